@@ -69,6 +69,25 @@ def main():
         help=("Path to the output directory. [required]")
     )
 
+    collapse_parser.add_argument(
+        "-f",
+        "--format",
+        metavar="TEXT",
+        default="csv",
+        choices=["csv", "csv.gz", "parquet", "feather"],
+        help=("Output file format ('csv', 'csv.gz', 'parquet', or "
+              "'feather'). [default: 'csv']")
+    )
+
+    collapse_parser.add_argument(
+        "-p",
+        "--threads",
+        metavar="INT",
+        type=int,
+        default=1,
+        help="Number of threads used to write the tables. [default: 1]"
+    )
+
     collapse_parser.add_argument(
         "-h",
         "--help",
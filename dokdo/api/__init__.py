@@ -1,5 +1,6 @@
-from .common import get_mf, pname
-from .ordinate import ordinate
+from .common import (get_mf, pname, set_export_cache, set_memory_cache,
+    clear_cache)
+from .ordinate import ordinate, project_samples
 from .num2sig import num2sig
 from .wilcoxon import wilcoxon
 from .mannwhitneyu import mannwhitneyu
@@ -13,7 +14,8 @@ from .beta_3d_plot import beta_3d_plot
 from. beta_scree_plot import beta_scree_plot
 from .beta_parallel_plot import beta_parallel_plot
 from .distance_matrix_plot import distance_matrix_plot
-from .taxa_abundance import taxa_abundance_bar_plot, taxa_abundance_box_plot
+from .taxa_abundance import (taxa_abundance_bar_plot,
+    taxa_abundance_box_plot, TaxaAbundance)
 from .ancom_volcano_plot import ancom_volcano_plot
 from .cross_association import (cross_association_table,
     cross_association_heatmap, cross_association_regplot,
@@ -24,6 +26,7 @@ from .addpairs import addpairs
 from .addbiplot import addbiplot
 from .clustermap import clustermap, heatmap
 from .regplot import regplot
+from .batch import batch_plot
 
 __all__ = ['alpha_diversity_plot', 'addpairs', 'wilcoxon',
            'mannwhitneyu', 'num2sig', 'clustermap', 'heatmap',
@@ -31,7 +34,9 @@ __all__ = ['alpha_diversity_plot', 'addpairs', 'wilcoxon',
            'alpha_rarefaction_plot', 'beta_2d_plot', 'beta_3d_plot',
            'beta_scree_plot', 'beta_parallel_plot', 'distance_matrix_plot',
            'taxa_abundance_bar_plot', 'taxa_abundance_box_plot',
-           'ancom_volcano_plot', 'cross_association_table',
+           'TaxaAbundance', 'ancom_volcano_plot', 'cross_association_table',
            'cross_association_heatmap', 'cross_association_regplot',
            'group_correlation_heatmap', 'addsig', 'regplot', 'addbiplot',
-           'ordinate', 'pname', 'get_mf']
+           'ordinate', 'project_samples', 'pname', 'get_mf',
+           'set_export_cache', 'set_memory_cache', 'clear_cache',
+           'batch_plot']
@@ -3,7 +3,7 @@ import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 from scipy.spatial.distance import euclidean
-from qiime2 import Artifact
+from . import common
 
 def addbiplot(
     pcoa_results, dim=2, scale=1.0, count=5, fontsize=None,
@@ -110,7 +110,7 @@ def addbiplot(
     .. image:: images/addbiplot-3.png
     """
     if isinstance(pcoa_results, str):
-        _pcoa_results = Artifact.load(pcoa_results)
+        _pcoa_results = common.load_artifact(pcoa_results)
     else:
         _pcoa_results = pcoa_results
 
@@ -125,7 +125,7 @@ def addbiplot(
 
     if taxonomy is not None:
         if isinstance(taxonomy, str):
-            _taxonomy = Artifact.load(taxonomy)
+            _taxonomy = common.load_artifact(taxonomy)
         else:
             _taxonomy = taxonomy
         tax_df = _taxonomy.view(pd.DataFrame)
@@ -1,4 +1,6 @@
-import pandas as pd
+from . import common
+
+import matplotlib.pyplot as plt
 import seaborn as sns
 import numpy as np
 
@@ -13,8 +15,10 @@ def addpairs(
     ----------
     taxon : str
         Target taxon name.
-    csv_file : str
+    csv_file : str or pandas.DataFrame
         Path to the .csv file from the `taxa_abundance_box_plot` method.
+        Alternatively, a :class:`pandas.DataFrame` object with its
+        contents, to avoid reading the file again.
     subject : str
         Column name to indicate pair information.
     category : str
@@ -131,7 +135,7 @@ def addpairs(
     if ax is None:
         fig, ax = plt.subplots(figsize=figsize)
 
-    df = pd.read_csv(csv_file)
+    df = common._read_csv(csv_file)
     df = df[[subject, category, taxon]]
     df = df.rename(columns={taxon: 'perc'})
 
@@ -3,7 +3,6 @@ from . import common
 import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
-from qiime2 import Artifact
 
 def alpha_diversity_plot(
     artifact, metadata, where, add_swarmplot=False, order=None,
@@ -68,7 +67,7 @@ def alpha_diversity_plot(
     .. image:: images/alpha_diversity_plot.png
     """
     if isinstance(artifact, str):
-        _alpha_diversity = Artifact.load(artifact)
+        _alpha_diversity = common.load_artifact(artifact)
         df = _alpha_diversity.view(pd.Series).to_frame()
     elif isinstance(artifact, pd.DataFrame):
         df = artifact
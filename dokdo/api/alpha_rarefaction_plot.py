@@ -1,5 +1,3 @@
-import tempfile
-
 from . import common
 
 import pandas as pd
@@ -101,9 +99,8 @@ def alpha_rarefaction_plot(
     if metric not in l:
         raise ValueError(f"Metric should be one of the following: {l}")
 
-    with tempfile.TemporaryDirectory() as t:
-        common.export(visualization, t)
-        df = pd.read_csv(f'{t}/{metric}.csv', index_col=0,
+    with common.open_data(visualization, f'{metric}.csv') as f:
+        df = pd.read_csv(f, index_col=0,
             keep_default_na=False, na_values=[''])
         df.to_csv('test.csv')
 
@@ -1,5 +1,3 @@
-import tempfile
-
 from . import common
 
 import pandas as pd
@@ -64,9 +62,8 @@ def ancom_volcano_plot(
 
     .. image:: images/ancom_volcano_plot_2.png
     """
-    with tempfile.TemporaryDirectory() as t:
-        common.export(visualization, t)
-        df = pd.read_table(f'{t}/data.tsv')
+    with common.open_data(visualization, 'data.tsv') as f:
+        df = pd.read_table(f)
 
     if ax is None:
         fig, ax = plt.subplots(figsize=figsize)
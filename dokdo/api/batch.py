@@ -0,0 +1,150 @@
+from . import common
+from .taxa_abundance import TaxaAbundance
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+from matplotlib.figure import Figure
+
+# Per-process state reused across plot specs: a single figure, the
+# TaxaAbundance objects built from each visualization file, and the
+# contents of each .csv file.
+_figure = None
+_taxa_abundance = {}
+_csv = {}
+
+# Methods whose csv_file argument is an input file. For other methods
+# (e.g. taxa_abundance_box_plot), csv_file is an output file.
+_CSV_INPUT_METHODS = ['regplot', 'addpairs']
+
+def _get_taxa_abundance(visualization, metadata):
+    """Returns the TaxaAbundance object cached for the given files."""
+    key = (visualization, metadata)
+    if key not in _taxa_abundance:
+        _taxa_abundance[key] = TaxaAbundance(visualization, metadata=metadata)
+    return _taxa_abundance[key]
+
+def _init_worker(maxsize):
+    """Prepares a worker process for rendering."""
+    matplotlib.use('Agg')
+    if maxsize:
+        common.set_memory_cache(maxsize)
+
+def _render(specs, tight_layout, savefig_kws):
+    """Renders the plot specs onto a reused figure and saves them."""
+    global _figure
+    from .. import api
+    if _figure is None:
+        _figure = Figure()
+    for spec in specs:
+        kwargs = dict(spec)
+        method = kwargs.pop('method')
+        output = kwargs.pop('output')
+        figsize = kwargs.pop('figsize', None)
+        _figure.clf()
+        _figure.set_size_inches(
+            figsize or matplotlib.rcParams['figure.figsize'])
+        ax = _figure.add_subplot()
+        visualization = kwargs.get('visualization')
+        metadata = kwargs.get('metadata')
+        if (method in ['taxa_abundance_bar_plot', 'taxa_abundance_box_plot']
+            and isinstance(visualization, str)
+            and (metadata is None or isinstance(metadata, str))):
+            del kwargs['visualization']
+            kwargs.pop('metadata', None)
+            ta = _get_taxa_abundance(visualization, metadata)
+            func = getattr(ta, method.replace('taxa_abundance_', ''))
+        else:
+            func = getattr(api, method)
+        csv_file = kwargs.get('csv_file')
+        if method in _CSV_INPUT_METHODS and isinstance(csv_file, str):
+            if csv_file not in _csv:
+                _csv[csv_file] = common._read_csv(csv_file)
+            kwargs['csv_file'] = _csv[csv_file]
+        func(ax=ax, **kwargs)
+        if tight_layout:
+            _figure.tight_layout()
+        _figure.savefig(output, **savefig_kws)
+
+def batch_plot(
+    specs, n_jobs=1, tight_layout=True, cache_size=32, **kwargs
+):
+    """
+    Render many plots to files.
+
+    Each plot is described by a spec, which is a dictionary with the name
+    of the plotting method (e.g. 'alpha_diversity_plot') under the 'method'
+    key, the path of the output file under the 'output' key, and the
+    arguments of the plotting method under the remaining keys. The 'figsize'
+    key, if present, sets the figure size.
+
+    Compared to calling the plotting methods in a loop, this method renders
+    all plots with the Agg backend on a figure that is reused across specs,
+    and loads each Artifact and Metadata file only once per process. Specs
+    for :meth:`taxa_abundance_bar_plot` and :meth:`taxa_abundance_box_plot`
+    with the same files also share a
+    :class:`dokdo.api.taxa_abundance.TaxaAbundance` object, and input .csv
+    files given as ``csv_file`` (i.e. for :meth:`regplot` and
+    :meth:`addpairs`) are read only once. Input files should therefore be
+    given as paths, not as objects. Output .csv files (e.g. for
+    :meth:`taxa_abundance_box_plot`) are written as usual. With ``n_jobs``
+    other than 1, the specs are rendered across a process pool.
+
+    Parameters
+    ----------
+    specs : list
+        List of plot specs.
+        Format: [{'method': str, 'output': str, ...}, ...].
+    n_jobs : int, default: 1
+        Number of processes to use. If None or negative, use all CPUs.
+    tight_layout : bool, default: True
+        Whether to adjust the padding of each figure before saving.
+    cache_size : int, default: 32
+        Maximum number of Artifact and Metadata files kept in memory by
+        each process. See :meth:`dokdo.api.common.set_memory_cache`.
+    kwargs : other keyword arguments
+        All other keyword arguments are passed to
+        :meth:`matplotlib.figure.Figure.savefig`.
+
+    Examples
+    --------
+
+    .. code:: python3
+
+        specs = []
+        for where in ['body-site', 'subject', 'reported-antibiotic-usage']:
+            specs.append({
+                'method': 'alpha_diversity_plot',
+                'output': f'shannon-{where}.png',
+                'artifact': 'shannon_vector.qza',
+                'metadata': 'sample-metadata.tsv',
+                'where': where,
+                'figsize': (5, 5),
+            })
+
+        dokdo.batch_plot(specs, n_jobs=4, dpi=150)
+    """
+    if n_jobs is None or n_jobs < 0:
+        n_jobs = os.cpu_count()
+    n_jobs = max(min(n_jobs, len(specs)), 1)
+    if n_jobs == 1:
+        previous = common._memory_cache['maxsize']
+        common.set_memory_cache(max(previous, cache_size))
+        try:
+            _render(specs, tight_layout, kwargs)
+        finally:
+            common.set_memory_cache(previous)
+            _taxa_abundance.clear()
+            _csv.clear()
+        return
+    # Contiguous chunks keep specs that share inputs in the same process.
+    size = -(-len(specs) // (n_jobs * 4))
+    chunks = [specs[i:i+size] for i in range(0, len(specs), size)]
+    with ProcessPoolExecutor(
+        n_jobs, initializer=_init_worker, initargs=(cache_size,)
+    ) as executor:
+        futures = [executor.submit(_render, x, tight_layout, kwargs)
+            for x in chunks]
+        for future in futures:
+            future.result()
@@ -4,7 +4,6 @@ import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
 from skbio.stats.ordination import OrdinationResults
-from qiime2 import Artifact
 
 def beta_2d_plot(
     artifact, metadata=None, hue=None, size=None,
@@ -157,7 +156,7 @@ def beta_2d_plot(
         df = artifact
     else:
         if isinstance(artifact, str):
-            _pcoa_results = Artifact.load(artifact)
+            _pcoa_results = common.load_artifact(artifact)
         else:
             _pcoa_results = artifact
         ordination_results = _pcoa_results.view(OrdinationResults)
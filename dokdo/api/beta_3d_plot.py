@@ -3,7 +3,6 @@ from . import common
 import pandas as pd
 import matplotlib.pyplot as plt
 from skbio.stats.ordination import OrdinationResults
-from qiime2 import Artifact
 
 def beta_3d_plot(
     artifact, metadata=None, hue=None, azim=-60, elev=30, s=80, ax=None,
@@ -130,7 +129,7 @@ def beta_3d_plot(
         df = artifact
     else:
         if isinstance(artifact, str):
-            _pcoa_results = Artifact.load(artifact)
+            _pcoa_results = common.load_artifact(artifact)
         else:
             _pcoa_results = artifact
         ordination_results = _pcoa_results.view(OrdinationResults)
@@ -1,6 +1,5 @@
 from . import common
 
-from qiime2 import Artifact
 
 import matplotlib.pyplot as plt
 import pandas as pd
@@ -84,7 +83,7 @@ def beta_parallel_plot(
     .. image:: images/beta_parallel_plot-2.png
     """
     if isinstance(artifact, str):
-        _pcoa_results = Artifact.load(artifact)
+        _pcoa_results = common.load_artifact(artifact)
     else:
         _pcoa_results = artifact
 
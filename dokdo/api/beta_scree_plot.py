@@ -2,7 +2,7 @@ import seaborn as sns
 import pandas as pd
 import matplotlib.pyplot as plt
 from skbio.stats.ordination import OrdinationResults
-from qiime2 import Artifact
+from . import common
 
 def beta_scree_plot(artifact, count=5, color='blue', ax=None, figsize=None):
     """
@@ -61,7 +61,7 @@ def beta_scree_plot(artifact, count=5, color='blue', ax=None, figsize=None):
     .. image:: images/beta_scree_plot.png
     """
     if isinstance(artifact, str):
-        _pcoa_results = Artifact.load(artifact)
+        _pcoa_results = common.load_artifact(artifact)
     else:
         _pcoa_results = artifact
 
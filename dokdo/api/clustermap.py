@@ -5,7 +5,6 @@ import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
 from matplotlib.patches import Patch
-from qiime2 import Artifact, Metadata
 from scipy.stats import zscore
 
 def _intersect_samples(df, metadata):
@@ -161,7 +160,7 @@ def heatmap(
         df = df.loc[samples]
     elif where is not None and samples is None:
         if isinstance(metadata, str):
-            metadata = Metadata.load(metadata)
+            metadata = common.load_metadata(metadata)
         samples = metadata.get_ids(where)
         df = df.loc[samples]
     else:
@@ -1,8 +1,14 @@
 # Import standard libraries.
+import os
 import math
+import shutil
+import zipfile
 import tempfile
 import warnings
 import numbers
+import threading
+import contextlib
+import collections
 
 # Import external libraries.
 import numpy as np
@@ -15,6 +21,7 @@ import seaborn as sns
 import skbio as sb
 from skbio.stats.ordination import OrdinationResults
 from scipy import stats
+import statsmodels.stats.multitest as multi
 from scipy.spatial.distance import euclidean
 from skbio.stats.composition import clr
 
@@ -37,16 +44,10 @@ def export(input, temp_dir):
     temp_dir : str
         Temporary directory.
     """
-    if isinstance(input, qiime2.Artifact):
-        fn = f'{temp_dir}/temp.qza'
-        input.save(fn)
-        input = fn
-        Artifact.load(input).export_data(temp_dir)
-    elif isinstance(input, qiime2.Visualization):
-        fn = f'{temp_dir}/temp.qzv'
-        input.save(fn)
-        input = fn
-        Visualization.load(input).export_data(temp_dir)
+    # Objects already hold their data in an extracted archive directory,
+    # so they are exported directly without saving and reloading them.
+    if isinstance(input, (qiime2.Artifact, qiime2.Visualization)):
+        input.export_data(temp_dir)
     elif isinstance(input, str) and input.endswith('.qza'):
         Artifact.load(input).export_data(temp_dir)
     elif isinstance(input, str) and input.endswith('.qzv'):
@@ -54,6 +55,271 @@ def export(input, temp_dir):
     else:
         raise TypeError(f'Incorrect input type detected: {type(input)}.')
 
+# Settings for the on-disk cache of exported QIIME 2 data. The cache is
+# disabled unless a directory is set with set_export_cache() or the
+# DOKDO_CACHE_DIR environment variable.
+_export_cache = {
+    'cache_dir': os.environ.get('DOKDO_CACHE_DIR'),
+    'max_size': 2 * 1024 ** 3,
+}
+
+# Marks a cache entry that holds all exported files.
+_COMPLETE = '.dokdo-complete'
+
+def set_export_cache(cache_dir=None, max_size=2 * 1024 ** 3):
+    """
+    Configure the on-disk cache of exported QIIME 2 data.
+
+    Plotting methods that read files from a QIIME 2 archive (e.g.
+    :meth:`taxa_abundance_bar_plot`) normally read them from the archive
+    on every call. When the cache is enabled, extracted files are stored in
+    ``cache_dir`` under the archive's UUID and reused by subsequent calls.
+    The cache also stores the rarefied tables and distance matrices
+    computed by :meth:`ordinate`. Once the cache grows beyond ``max_size``
+    bytes, the least recently used entries are removed.
+
+    The cache directory can also be set with the ``DOKDO_CACHE_DIR``
+    environment variable.
+
+    Parameters
+    ----------
+    cache_dir : str, optional
+        Cache directory. When None, disable the cache.
+    max_size : int, default: 2147483648
+        Maximum size of the cache in bytes (2 GB by default).
+
+    Examples
+    --------
+
+    .. code:: python3
+
+        import dokdo
+        dokdo.set_export_cache('/Users/sbslee/.cache/dokdo')
+    """
+    _export_cache['cache_dir'] = cache_dir
+    _export_cache['max_size'] = max_size
+
+def _get_uuid(input):
+    """Returns the UUID of a QIIME 2 file or object."""
+    if isinstance(input, (qiime2.Artifact, qiime2.Visualization)):
+        return str(input.uuid)
+    elif isinstance(input, str) and input.endswith(('.qza', '.qzv')):
+        with zipfile.ZipFile(input) as zf:
+            return zf.namelist()[0].split('/')[0]
+    else:
+        raise TypeError(f'Incorrect input type detected: {type(input)}.')
+
+def _get_size(path):
+    """Returns the total size of files under a directory."""
+    size = 0
+    for root, dirs, files in os.walk(path):
+        for file in files:
+            size += os.path.getsize(os.path.join(root, file))
+    return size
+
+def _evict(cache_dir, max_size, keep):
+    """Removes least recently used cache entries until under the limit."""
+    entries = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name.startswith('.') or not os.path.isdir(path):
+            continue
+        entries.append((os.path.getmtime(path), _get_size(path), path))
+    total = sum(x[1] for x in entries)
+    for mtime, size, path in sorted(entries):
+        if total <= max_size:
+            break
+        if path == keep:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+
+@contextlib.contextmanager
+def exported(input):
+    """
+    Yield a directory containing the exported data of QIIME 2 file or
+    object.
+
+    When the export cache is enabled (see :meth:`set_export_cache`), the
+    directory is a cache entry keyed by the archive's UUID and is reused
+    across calls. Otherwise, data are exported to a temporary directory
+    which is removed on exit.
+
+    Parameters
+    ----------
+    input : str, qiime2.Artifact, or qiime2.Visualization
+        QIIME 2 file or object.
+    """
+    cache_dir = _export_cache['cache_dir']
+    if cache_dir is None:
+        with tempfile.TemporaryDirectory() as t:
+            export(input, t)
+            yield t
+        return
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, _get_uuid(input))
+    if os.path.isfile(os.path.join(path, _COMPLETE)):
+        os.utime(path)
+    else:
+        # Export to a temporary directory first so that other processes
+        # never see a partially exported entry. An existing entry may only
+        # hold some of the files (see open_data), so it is replaced.
+        temp_dir = tempfile.mkdtemp(prefix='.', dir=cache_dir)
+        try:
+            export(input, temp_dir)
+            open(os.path.join(temp_dir, _COMPLETE), 'w').close()
+            shutil.rmtree(path, ignore_errors=True)
+            os.replace(temp_dir, path)
+        except OSError:
+            if not os.path.isfile(os.path.join(path, _COMPLETE)):
+                raise
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+        _evict(cache_dir, _export_cache['max_size'], path)
+    yield path
+
+@contextlib.contextmanager
+def open_data(input, filename):
+    """
+    Yield a binary file object for a single file of QIIME 2 file or object.
+
+    Unlike :meth:`exported`, this method does not extract the whole archive.
+    The requested file is streamed directly from ``<uuid>/data/`` inside the
+    .qza or .qzv file, or read in place from the data directory of QIIME 2
+    object. When the export cache is enabled, only that file is
+    extracted to the cache entry and reused by subsequent calls.
+
+    Parameters
+    ----------
+    input : str, qiime2.Artifact, or qiime2.Visualization
+        QIIME 2 file or object.
+    filename : str
+        Path of the file relative to the data directory (e.g.
+        'level-6.csv').
+    """
+    if isinstance(input, (qiime2.Artifact, qiime2.Visualization)):
+        # Read the file in place from the object's data directory, which is
+        # an implementation detail of QIIME 2 and may not always exist.
+        data_dir = getattr(getattr(input, '_archiver', None), 'data_dir', None)
+        if data_dir is not None:
+            with open(os.path.join(str(data_dir), filename), 'rb') as f:
+                yield f
+            return
+    if not isinstance(input, str):
+        with exported(input) as t:
+            with open(os.path.join(t, filename), 'rb') as f:
+                yield f
+        return
+    uuid = _get_uuid(input)
+    cache_dir = _export_cache['cache_dir']
+    if cache_dir is not None:
+        path = os.path.join(cache_dir, uuid, filename)
+        if os.path.isfile(path):
+            os.utime(os.path.join(cache_dir, uuid))
+            with open(path, 'rb') as f:
+                yield f
+            return
+    with zipfile.ZipFile(input) as zf:
+        try:
+            info = zf.getinfo(f'{uuid}/data/{filename}')
+        except KeyError:
+            raise FileNotFoundError(
+                f"File '{filename}' not found in '{input}'") from None
+        if cache_dir is None:
+            with zf.open(info) as f:
+                yield f
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_file = tempfile.mkstemp(prefix='.', dir=cache_dir)
+        with zf.open(info) as src, os.fdopen(fd, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(temp_file, path)
+    _evict(cache_dir, _export_cache['max_size'], os.path.join(cache_dir, uuid))
+    with open(path, 'rb') as f:
+        yield f
+
+# In-memory cache of QIIME 2 files loaded from disk, keyed by path,
+# modification time, and size. The cache is disabled unless enabled with
+# set_memory_cache().
+_memory_cache = {
+    'maxsize': 0,
+    'items': collections.OrderedDict(),
+    'lock': threading.Lock(),
+}
+
+def set_memory_cache(maxsize=32):
+    """
+    Configure the in-memory cache of loaded QIIME 2 files.
+
+    By default, every method reloads Artifact and Metadata files from disk
+    whenever a path is given. When the cache is enabled, files loaded with
+    the same path are served from memory as long as their modification
+    time and size are unchanged. Once more than ``maxsize`` files are
+    cached, the least recently used ones are removed.
+
+    Parameters
+    ----------
+    maxsize : int, default: 32
+        Maximum number of cached files. When 0, disable the cache.
+
+    See Also
+    --------
+    dokdo.api.common.clear_cache
+
+    Examples
+    --------
+
+    .. code:: python3
+
+        import dokdo
+        dokdo.set_memory_cache()
+    """
+    with _memory_cache['lock']:
+        _memory_cache['maxsize'] = maxsize
+        while len(_memory_cache['items']) > maxsize:
+            _memory_cache['items'].popitem(last=False)
+
+def clear_cache():
+    """
+    Remove all files from the in-memory cache.
+
+    See Also
+    --------
+    dokdo.api.common.set_memory_cache
+    """
+    with _memory_cache['lock']:
+        _memory_cache['items'].clear()
+
+def _load(loader, path):
+    """Returns the loaded file, from the in-memory cache if possible."""
+    if not _memory_cache['maxsize']:
+        return loader(path)
+    stat = os.stat(path)
+    key = (loader, os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    items = _memory_cache['items']
+    with _memory_cache['lock']:
+        if key in items:
+            items.move_to_end(key)
+            return items[key]
+    result = loader(path)
+    with _memory_cache['lock']:
+        items[key] = result
+        while len(items) > _memory_cache['maxsize']:
+            items.popitem(last=False)
+    return result
+
+def load_artifact(path):
+    """
+    Load an Artifact file, using the in-memory cache if enabled.
+    """
+    return _load(Artifact.load, path)
+
+def load_metadata(path):
+    """
+    Load a Metadata file, using the in-memory cache if enabled.
+    """
+    return _load(Metadata.load, path)
+
 def get_mf(metadata):
     """
     Convert a Metadata file or object to a dataframe.
@@ -89,7 +355,7 @@ def get_mf(metadata):
         # L2S155        ACGATGCGACCA  left palm  ...                         No                         84.0
     """
     if isinstance(metadata, str):
-        mf = Metadata.load(metadata).to_dataframe()
+        mf = load_metadata(metadata).to_dataframe()
     elif isinstance(metadata, Metadata):
         mf = metadata.to_dataframe()
     else:
@@ -163,3 +429,31 @@ def pname(name, levels=None, delimiter=';'):
         if 'Unassigned' in ranks:
             return 'Unassigned'
         return delimiter.join([ranks[x-1] for x in levels])
+
+def _read_csv(csv_file):
+    """Returns DataFrame object from the .csv file, or the input DataFrame
+    object as is."""
+    if isinstance(csv_file, pd.DataFrame):
+        return csv_file
+    return pd.read_csv(csv_file)
+
+def _get_taxa(df, taxon):
+    """Returns the list of taxa to be tested. If ``taxon`` is None, returns
+    all taxa columns."""
+    if taxon is None:
+        return [x for x in df.columns
+            if '__' in x or 'Unassigned' in x or x == 'Others']
+    return list(taxon)
+
+def _test_table(taxa, statistic, pval, multitest):
+    """Returns DataFrame object with the test results for multiple taxa,
+    sorted by p-value."""
+    pval = np.asarray(pval, dtype=float)
+    adjp = np.full(len(pval), np.nan)
+    i = ~np.isnan(pval)
+    if i.any():
+        adjp[i] = multi.multipletests(pval[i], method=multitest)[1]
+    df = pd.DataFrame({'taxon': taxa, 'statistic': statistic,
+        'pval': pval, 'adjp': adjp})
+    df = df.sort_values('pval', kind='stable').reset_index(drop=True)
+    return df
@@ -1,15 +1,272 @@
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
 import numpy as np
 import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
-from scipy.stats import spearmanr, pearsonr
+from scipy import stats
 import statsmodels.stats.multitest as multi
 from qiime2 import Artifact, Metadata
 from . import common, utils
 
+_COLUMNS = ['taxon', 'target', 'corr', 'pval', 'adjp']
+
+_CHUNK_DTYPE = [('taxon', 'i8'), ('target', 'i8'), ('corr', 'f8'),
+    ('pval', 'f8')]
+
+# Maximum number of permuted correlations held in memory at a time.
+_PERMUTATION_BATCH = 2 ** 24
+
+# Number of permutations between checks for early stopping.
+_EARLY_STOP_STEP = 100
+
+def _standardize(a, method):
+    """Returns array with columns centered and scaled to unit norm."""
+    a = np.asarray(a, dtype=float)
+    if method == 'spearman':
+        a = stats.rankdata(a, axis=0)
+    a = a - a.mean(axis=0)
+    norm = np.sqrt((a ** 2).sum(axis=0))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        a = a / norm
+    return a
+
+def _correlate(x, y, perms=None, early_stop=None):
+    """Returns correlation coefficients and p-values between columns."""
+    corr = np.clip(x.T @ y, -1, 1)
+    if perms is not None:
+        return corr, _permutation_pvalues(x, y, corr, perms, early_stop)
+    dof = x.shape[0] - 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = corr * np.sqrt(dof / ((1 - corr) * (1 + corr)))
+    pval = 2 * stats.t.sf(np.abs(t), dof)
+    return corr, pval
+
+def _permutation_pvalues(x, y, corr, perms, early_stop):
+    """Returns two-sided p-values from shuffling the sample axis of y.
+
+    Permutations are evaluated in batches with a single broadcast matrix
+    multiply, shuffling whichever of x and y has fewer active columns.
+    When ``early_stop`` is given, a pair stops being evaluated once that
+    many permuted correlations were at least as extreme as the observed
+    one (Besag and Clifford, 1991), and rows and columns without any active
+    pair are dropped from the following batches. This is checked every
+    ``_EARLY_STOP_STEP`` permutations regardless of the batch size, so
+    that results do not depend on how the features and targets are split.
+    """
+    observed = np.abs(corr) * (1 - 1e-12)
+    hits = np.zeros(corr.shape, dtype=int)
+    done = np.zeros(corr.shape, dtype=int)
+    active = ~np.isnan(corr)
+    n = x.shape[0]
+    step = _EARLY_STOP_STEP if early_stop else len(perms)
+    for checkpoint in range(0, len(perms), step):
+        rows = np.flatnonzero(active.any(axis=1))
+        cols = np.flatnonzero(active.any(axis=0))
+        if not rows.size:
+            break
+        block = np.ix_(rows, cols)
+        mask = active[block]
+        # Each permutation needs a permuted copy of the smaller side as well
+        # as its block of correlations.
+        size = max(1, _PERMUTATION_BATCH
+            // (n * min(rows.size, cols.size) + rows.size * cols.size))
+        stop = min(checkpoint + step, len(perms))
+        for start in range(checkpoint, stop, size):
+            batch = perms[start:min(start + size, stop)]
+            if rows.size < cols.size:
+                # Shuffling x with the inverse permutation gives the same
+                # correlations as shuffling y, i.e. x[inverse].T @ y equals
+                # x.T @ y[perm].
+                inverse = np.argsort(batch, axis=1)
+                permuted = (np.swapaxes(x[:, rows][inverse], 1, 2)
+                    @ y[:, cols])
+            else:
+                permuted = x[:, rows].T @ y[:, cols][batch]
+            exceeded = (np.abs(permuted) >= observed[block]).sum(axis=0)
+            hits[block] += exceeded * mask
+            done[block] += len(batch) * mask
+        if early_stop:
+            active[block] &= hits[block] < early_stop
+    pval = (hits + 1) / (done + 1)
+    pval[np.isnan(corr)] = np.nan
+    return pval
+
+def _share(a):
+    """Returns a shared memory block holding a copy of the array."""
+    shm = shared_memory.SharedMemory(create=True, size=max(a.nbytes, 1))
+    np.ndarray(a.shape, dtype=a.dtype, buffer=shm.buf)[:] = a
+    return shm, (shm.name, a.shape, a.dtype.str)
+
+def _correlate_block(
+    x_spec, y_spec, corr_spec, pval_spec, perms_spec, early_stop, start, stop
+):
+    """Computes correlations for a block of features in a worker process."""
+    specs = [x_spec, y_spec, corr_spec, pval_spec]
+    if perms_spec is not None:
+        specs.append(perms_spec)
+    blocks = [shared_memory.SharedMemory(name=spec[0]) for spec in specs]
+    arrays = [np.ndarray(spec[1], dtype=spec[2], buffer=shm.buf)
+        for shm, spec in zip(blocks, specs)]
+    x, y, corr, pval = arrays[:4]
+    perms = arrays[4] if perms_spec is not None else None
+    corr[start:stop], pval[start:stop] = _correlate(
+        x[:, start:stop], y, perms, early_stop)
+    del x, y, corr, pval, perms, arrays
+    for shm in blocks:
+        shm.close()
+
+class _Correlator:
+    """Computes correlations against a fixed block of features.
+
+    With ``n_jobs`` other than 1, the feature axis is split across a process
+    pool. Input and output matrices live in shared memory so that they are
+    not pickled for each task, and every worker writes its own rows.
+
+    When ``perms`` is given, p-values are computed from permutations
+    instead of the t-distribution. All workers share the same permutations
+    and check for early stopping at the same permutation counts, so that
+    p-values do not depend on ``n_jobs``.
+    """
+    def __init__(self, x, n_jobs=1, perms=None, early_stop=None):
+        if n_jobs is None or n_jobs < 0:
+            n_jobs = os.cpu_count()
+        self.x = x
+        self.perms = perms
+        self.early_stop = early_stop
+        self.n_jobs = min(n_jobs, max(x.shape[1], 1))
+        self.pool = None
+        self.blocks = []
+        self.perms_spec = None
+        if self.n_jobs > 1:
+            self.pool = ProcessPoolExecutor(self.n_jobs)
+            shm, self.x_spec = _share(x)
+            self.blocks.append(shm)
+            if perms is not None:
+                shm, self.perms_spec = _share(perms)
+                self.blocks.append(shm)
+
+    def __call__(self, y):
+        if self.pool is None:
+            return _correlate(self.x, y, self.perms, self.early_stop)
+        shape = (self.x.shape[1], y.shape[1])
+        blocks = [_share(y), _share(np.empty(shape)),
+            _share(np.empty(shape))]
+        (y_shm, y_spec), (c_shm, c_spec), (p_shm, p_spec) = blocks
+        try:
+            bounds = np.linspace(0, shape[0], self.n_jobs + 1).astype(int)
+            futures = [self.pool.submit(_correlate_block, self.x_spec,
+                y_spec, c_spec, p_spec, self.perms_spec, self.early_stop,
+                start, stop)
+                for start, stop in zip(bounds[:-1], bounds[1:])]
+            for future in futures:
+                future.result()
+            corr = np.ndarray(shape, dtype=float, buffer=c_shm.buf).copy()
+            pval = np.ndarray(shape, dtype=float, buffer=p_shm.buf).copy()
+        finally:
+            for shm, _ in blocks:
+                shm.close()
+                shm.unlink()
+        return corr, pval
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+        for shm in self.blocks:
+            shm.close()
+            shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def _iter_chunks(correlate, target, method, chunksize, pcutoff, rcutoff):
+    """Yields surviving pairs for each block of target columns."""
+    if chunksize is None:
+        chunksize = max(target.shape[1], 1)
+    for start in range(0, target.shape[1], chunksize):
+        y = target.iloc[:, start:start+chunksize].to_numpy()
+        y = _standardize(y, method)
+        corr, pval = correlate(y)
+        # Pairs are listed target by target to keep the output order.
+        corr, pval = corr.T, pval.T
+        mask = np.ones(corr.shape, dtype=bool)
+        if pcutoff is not None:
+            mask &= pval <= pcutoff
+        if rcutoff is not None:
+            mask &= np.abs(corr) >= rcutoff
+        j, i = np.nonzero(mask)
+        chunk = np.empty(len(i), dtype=_CHUNK_DTYPE)
+        chunk['taxon'] = i
+        chunk['target'] = j + start
+        chunk['corr'] = corr[j, i]
+        chunk['pval'] = pval[j, i]
+        yield chunk
+
+def _multipletests(pval, method, ntests):
+    """Returns adjusted p-values, accounting for pre-filtered tests."""
+    if len(pval) == ntests:
+        return multi.multipletests(pval, method=method)[1]
+    # Pre-filtered tests have larger p-values than the stored ones. The
+    # adjustment is exact for Bonferroni and Holm, and conservative for
+    # Benjamini-Hochberg.
+    order = np.argsort(pval)
+    p = pval[order]
+    rank = np.arange(1, len(p) + 1)
+    if method == 'bonferroni':
+        p = p * ntests
+    elif method == 'holm':
+        p = np.maximum.accumulate(p * (ntests - rank + 1))
+    elif method == 'fdr_bh':
+        p = np.minimum.accumulate((p * ntests / rank)[::-1])[::-1]
+    else:
+        raise ValueError("Only 'bonferroni', 'holm', and 'fdr_bh' can be "
+                         "used with 'pcutoff' or 'rcutoff'")
+    adjp = np.empty(len(p))
+    adjp[order] = np.minimum(p, 1)
+    return adjp
+
+class _Sink:
+    """Appends chunks of rows to a .csv, .csv.gz, or .parquet file."""
+    def __init__(self, path):
+        if not path.endswith(('.csv', '.csv.gz', '.parquet')):
+            raise ValueError(f"Incorrect output file extension: '{path}'")
+        self.path = path
+        self.writer = None
+        self.header = True
+
+    def write(self, df):
+        if self.path.endswith('.parquet'):
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            if self.writer is None:
+                schema = pa.schema([('taxon', pa.string()),
+                    ('target', pa.string()), ('corr', pa.float64()),
+                    ('pval', pa.float64()), ('adjp', pa.float64())])
+                self.writer = pq.ParquetWriter(self.path, schema)
+            table = pa.Table.from_pandas(df, schema=self.writer.schema,
+                preserve_index=False)
+            self.writer.write_table(table)
+        else:
+            mode = 'w' if self.header else 'a'
+            df.to_csv(self.path, mode=mode, header=self.header, index=False)
+        self.header = False
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        elif self.header:
+            self.write(pd.DataFrame(columns=_COLUMNS))
+
 def cross_association_table(
     artifact, target, method='spearman', normalize=None, alpha=0.05,
-    multitest='fdr_bh', nsig=0
+    multitest='fdr_bh', nsig=0, chunksize=None, pcutoff=None, rcutoff=None,
+    output=None, n_jobs=1, permutations=0, seed=None, early_stop=10
 ):
     """
     Compute cross-correlation between feature table and target matrices.
@@ -47,12 +304,56 @@ def cross_association_table(
         :meth:`statsmodels.stats.multitest.multipletests`.
     nsig : int, default: 0
         Mininum number of significant correlations for each element.
+    chunksize : int, optional
+        Number of target columns to process at a time. When provided,
+        surviving pairs are kept on disk between passes so that peak memory
+        is bounded by the chunk size and the number of surviving pairs
+        rather than the full matrix.
+    pcutoff : float, optional
+        Only keep pairs with a p-value less than or equal to this value.
+        Multiple testing correction still accounts for all pairs.
+    rcutoff : float, optional
+        Only keep pairs with an absolute correlation coefficient greater
+        than or equal to this value. Multiple testing correction still
+        accounts for all pairs.
+    output : str, optional
+        Path of the output file (.csv, .csv.gz, or .parquet). When
+        provided, rows are streamed to the file chunk by chunk, without
+        sorting by p-value, and nothing is returned.
+    n_jobs : int, default: 1
+        Number of worker processes used to split the feature axis. When -1,
+        use all available CPUs. The output does not depend on this value,
+        apart from rounding of correlation coefficients in the last digit.
+    permutations : int, default: 0
+        Number of sample shuffles used to compute permutation p-values.
+        When 0, compute parametric p-values from the t-distribution.
+    seed : int, optional
+        Seed for the random number generator used to shuffle the samples.
+    early_stop : int, default: 10
+        Ignored when ``permutations=0``. Stop shuffling a pair once this many
+        permuted correlations are at least as extreme as the observed one,
+        which saves time for pairs that are clearly not significant. This
+        is checked every 100 permutations. When None, always perform all
+        permutations.
 
     Returns
     -------
     pandas.DataFrame
         Cross-association table.
 
+    Notes
+    -----
+    When ``pcutoff`` or ``rcutoff`` is used, ``multitest`` must be one of
+    'bonferroni', 'holm', or 'fdr_bh'. In the case of 'fdr_bh', adjusted
+    p-values are conservative because the pairs that did not pass the
+    cutoff are not available for the correction.
+
+    With ``nsig``, only the pairs that pass ``pcutoff`` and ``rcutoff`` are
+    counted as significant correlations. When ``pcutoff`` is less than
+    ``alpha`` or ``rcutoff`` is used, pairs with an adjusted p-value less
+    than or equal to ``alpha`` may be dropped by the cutoff and are then
+    not counted, so fewer elements may pass ``nsig``.
+
     See Also
     --------
     dokdo.api.cross_association.cross_association_heatmap
@@ -90,58 +391,89 @@ def cross_association_table(
     if isinstance(artifact, Artifact):
         feats = artifact.view(pd.DataFrame)
     elif isinstance(artifact, str):
-        feats = Artifact.load(artifact).view(pd.DataFrame)
+        feats = common.load_artifact(artifact).view(pd.DataFrame)
     elif isinstance(artifact, pd.DataFrame):
         feats = artifact.copy()
     else:
         raise TypeError(f"Incorrect feature table type: {type(artifact)}")
 
-    if normalize == 'log10':
-        feats = feats.applymap(lambda x: np.log10(x + 1))
-    elif normalize == 'clr':
-        feats = feats.apply(lambda x: clr(x + 1), axis=1,
-            result_type='broadcast')
-    elif normalize == 'zscore':
-        feats = feats.apply(zscore, axis=1,
-            result_type='broadcast')
-    elif not normalize:
-        pass
-    else:
-        raise ValueError(f"Incorrect normalization method: '{normalize}'")
-
-    methods = {'pearson': pearsonr, 'spearman': spearmanr}
-
-    corr = np.zeros((feats.shape[1], target.shape[1]))
-    pval = np.zeros((feats.shape[1], target.shape[1]))
-
-    for i in range(feats.shape[1]):
-        for j in range(target.shape[1]):
-            results = methods[method](feats[feats.columns[i]],
-                target[target.columns[j]])
-            corr[i, j] = results[0]
-            pval[i, j] = results[1]
-
-    corr = pd.DataFrame(corr, columns=target.columns, index=feats.columns)
-    pval = pd.DataFrame(pval, columns=target.columns, index=feats.columns)
-
-    corr = corr.melt(var_name='target', value_name='corr', ignore_index=False)
-    pval = pval.melt(var_name='target', value_name='pval', ignore_index=False)
+    if normalize:
+        feats = utils.normalize_feature_table(feats, normalize, copy=False)
 
-    df = pd.concat([corr, pval['pval']], axis=1)
-    df.index.name = 'taxon'
-    df = df.reset_index()
-    df['adjp'] = multi.multipletests(df['pval'], method=multitest)[1]
+    if method not in ['spearman', 'pearson']:
+        raise ValueError(f"Incorrect association method: '{method}'")
 
-    if nsig:
-        adjp = df.pivot(index='taxon', columns='target', values='adjp')
-        sig = adjp <= alpha
-        s = sig.sum(axis=1)
-        taxon_survivors = s[s >= nsig].index.to_list()
-        s = sig.sum(axis=0)
-        target_survivors = s[s >= nsig].index.to_list()
-        df = df[df['taxon'].isin(taxon_survivors)]
-        df = df[df['target'].isin(target_survivors)]
+    x = _standardize(feats.to_numpy(), method)
 
+    if permutations:
+        rng = np.random.default_rng(seed)
+        perms = rng.permuted(
+            np.tile(np.arange(x.shape[0]), (permutations, 1)), axis=1)
+    else:
+        perms = None
+
+    with _Correlator(x, n_jobs, perms, early_stop) as correlate, \
+         tempfile.TemporaryDirectory() as t:
+        chunks = _iter_chunks(correlate, target, method, chunksize, pcutoff,
+            rcutoff)
+
+        # Store surviving pairs in memory, or on disk when chunking.
+        if chunksize is None:
+            store = list(chunks)
+            load = lambda k: store[k]
+        else:
+            store = []
+            for k, chunk in enumerate(chunks):
+                np.save(f'{t}/chunk-{k}.npy', chunk)
+                store.append(f'{t}/chunk-{k}.npy')
+            load = lambda k: np.load(store[k], mmap_mode='r')
+
+        # Apply the multiple testing correction over all stored p-values.
+        ntests = feats.shape[1] * target.shape[1]
+        pval = np.concatenate([load(k)['pval'] for k in range(len(store))])
+        adjp = _multipletests(pval, multitest, ntests)
+        del pval
+        offsets = np.cumsum([0] + [len(load(k)) for k in range(len(store))])
+
+        if nsig:
+            taxon_counts = np.zeros(feats.shape[1], dtype=int)
+            target_counts = np.zeros(target.shape[1], dtype=int)
+            for k in range(len(store)):
+                chunk = load(k)
+                sig = adjp[offsets[k]:offsets[k+1]] <= alpha
+                taxon_counts += np.bincount(chunk['taxon'][sig],
+                    minlength=feats.shape[1])
+                target_counts += np.bincount(chunk['target'][sig],
+                    minlength=target.shape[1])
+            taxon_survivors = taxon_counts >= nsig
+            target_survivors = target_counts >= nsig
+
+        sink = None if output is None else _Sink(output)
+        dfs = []
+
+        for k in range(len(store)):
+            chunk = load(k)
+            df = pd.DataFrame({
+                'taxon': feats.columns[chunk['taxon']],
+                'target': target.columns[chunk['target']],
+                'corr': chunk['corr'],
+                'pval': chunk['pval'],
+                'adjp': adjp[offsets[k]:offsets[k+1]],
+            })
+            if nsig:
+                i = (taxon_survivors[chunk['taxon']] &
+                     target_survivors[chunk['target']])
+                df = df[i]
+            if sink is None:
+                dfs.append(df)
+            else:
+                sink.write(df)
+
+    if sink is not None:
+        sink.close()
+        return None
+
+    df = pd.concat(dfs)
     df = df.sort_values('pval')
     df = df.reset_index(drop=True)
 
@@ -323,7 +655,7 @@ def group_correlation_heatmap(
     artifact, group1_samples, group2_samples, group1_label=None,
     group2_label=None, taxa_names=None, count=0, sort_by_mean=True,
     normalize=None, method='spearman', alpha=0.05, csv_file=None, ax=None,
-    figsize=None, **kwargs
+    figsize=None, n_jobs=1, **kwargs
 ):
     """
     Create a heatmap showing cross-correlation of taxa abundance between two
@@ -366,6 +698,9 @@ def group_correlation_heatmap(
         Axes object to draw the plot onto, otherwise uses the current Axes.
     figsize : tuple, optional
         Width, height in inches. Format: (float, float).
+    n_jobs : int, default: 1
+        Number of worker processes used to compute the correlations. When
+        -1, use all available CPUs.
     kwargs : other keyword arguments
         Other keyword arguments will be passed down to
         :meth:`seaborn.heatmap()`.
@@ -408,7 +743,10 @@ def group_correlation_heatmap(
 
     .. image:: images/group_correlation_heatmap-1.png
     """
-    df = utils.import_feature_table(artifact)
+    # Keep the table sparse unless the normalization requires all taxa to
+    # be dense. Only the selected taxa and samples are densified.
+    df = utils.import_feature_table(artifact,
+        sparse=normalize in [None, 'log10'])
 
     if len(group1_samples) != len(group2_samples):
         raise ValueError(f"Two groups have different sizes: {len(group1)} and {len(group2)}, respectively ")
@@ -427,29 +765,32 @@ def group_correlation_heatmap(
 
     df = df[df.index.isin(group1_samples + group2_samples)]
 
+    if utils.is_sparse(df):
+        df = df.sparse.to_dense()
+
     if csv_file is not None:
         df.to_csv(csv_file)
 
     df1 = df.loc[group1_samples]
     df2 = df.loc[group2_samples]
 
-    methods = {'pearson': pearsonr, 'spearman': spearmanr}
-
-    size = max(df1.shape[1], df2.shape[1])
+    if method not in ['spearman', 'pearson']:
+        raise ValueError(f"Incorrect association method: '{method}'")
 
     cols = [common.pname(x) for x in df1.columns]
 
-    rho_df = pd.DataFrame(np.zeros((size, size)), index=cols, columns=cols)
-    pval_df = pd.DataFrame(np.zeros((size, size)), index=cols, columns=cols)
+    x1 = _standardize(df1.to_numpy(), method)
+    x2 = _standardize(df2.to_numpy(), method)
+
+    with _Correlator(x1, n_jobs) as correlate:
+        rho, pval = correlate(x2)
 
-    for i, t1 in enumerate(df1.columns):
-        for j, t2 in enumerate(df2.columns):
-            rho, pval = methods[method](df1[t1], df2[t2])
+    # Constant taxa have undefined correlations.
+    undefined = np.isnan(rho)
+    rho[undefined], pval[undefined] = 0, 1
 
-            if np.isnan(rho):
-                rho, pval = 0, 1
-            rho_df.iloc[i, j] = rho
-            pval_df.iloc[i, j] = pval
+    rho_df = pd.DataFrame(rho, index=cols, columns=cols)
+    pval_df = pd.DataFrame(pval, index=cols, columns=cols)
 
     pval_df = pval_df.applymap(lambda x: '*' if x <= alpha else '')
 
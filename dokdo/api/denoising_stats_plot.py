@@ -1,5 +1,3 @@
-import tempfile
-
 from . import common
 
 import pandas as pd
@@ -66,9 +64,8 @@ def denoising_stats_plot(
 
     .. image:: images/denoising_stats_plot.png
     """
-    with tempfile.TemporaryDirectory() as t:
-        common.export(artifact, t)
-        df1 = pd.read_table(f'{t}/stats.tsv', skiprows=[1], index_col=0)
+    with common.open_data(artifact, 'stats.tsv') as f:
+        df1 = pd.read_table(f, skiprows=[1], index_col=0)
 
     mf = common.get_mf(metadata)
 
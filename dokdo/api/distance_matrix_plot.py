@@ -3,7 +3,7 @@ import tempfile
 import pandas as pd
 import skbio as sb
 import matplotlib.pyplot as plt
-from qiime2 import Artifact
+from . import common
 
 def distance_matrix_plot(
     distance_matrix, bins=100, pairs=None, density=False, ax=None,
@@ -72,7 +72,7 @@ def distance_matrix_plot(
     .. image:: images/distance_matrix_plot-3.png
     """
     if isinstance(distance_matrix, str):
-        _distance_matrix = Artifact.load(distance_matrix)
+        _distance_matrix = common.load_artifact(distance_matrix)
     else:
         _distance_matrix = distance_matrix
 
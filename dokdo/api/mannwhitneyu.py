@@ -1,10 +1,52 @@
-import pandas as pd
-from scipy import stats
+from . import common
 from .num2sig import num2sig
 
+import numpy as np
+from scipy import stats
+
+def _rank_sum_test(x, y):
+    """Returns the statistics and p-values of the Mann–Whitney U test for
+    every column of the two arrays, following the defaults of the
+    :meth:`scipy.stats.mannwhitneyu()` method (i.e. two-sided with
+    continuity correction and exact for small samples without ties)."""
+    n1, n2 = x.shape[0], y.shape[0]
+    xy = np.concatenate([x, y])
+    r = stats.rankdata(xy, axis=0)
+    t = stats.rankdata(xy, 'max', axis=0) - stats.rankdata(xy, 'min', axis=0)
+    tie_term = (t * (t + 2)).sum(axis=0)
+    u1 = r[:n1].sum(axis=0) - n1 * (n1 + 1) / 2
+    u = np.maximum(u1, n1 * n2 - u1)
+    n = n1 + n2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        s = np.sqrt(n1 * n2 / 12 * ((n + 1) - tie_term / (n * (n - 1))))
+        p = 2 * stats.norm.sf((u - n1 * n2 / 2 - 0.5) / s)
+    valid = ~np.isnan(xy).any(axis=0)
+    if n1 <= 8 or n2 <= 8:
+        exact = valid & (tie_term == 0)
+        if exact.any():
+            sf = _rank_sum_counts(n1, n2)[::-1].cumsum()[::-1]
+            p[exact] = 2 * sf[u[exact].astype(int)] / sf[0]
+    u1[~valid] = np.nan
+    p[~valid] = np.nan
+    return u1, np.clip(p, 0, 1)
+
+def _rank_sum_counts(n1, n2):
+    """Returns the number of orderings of two samples without ties that
+    give each value of the U statistic, from 0 to n1 * n2."""
+    m, n = min(n1, n2), max(n1, n2)
+    # counts[i] is for samples of sizes i and j, updated for j = 0 to n.
+    counts = [np.ones(1) for i in range(m + 1)]
+    for j in range(1, n + 1):
+        for i in range(1, m + 1):
+            c = np.zeros(i * j + 1)
+            c[j:] += counts[i - 1]
+            c[:i * (j - 1) + 1] += counts[i]
+            counts[i] = c
+    return counts[m]
+
 def mannwhitneyu(
     taxon, csv_file, category,
-    group1, group2, ann=False
+    group1, group2, ann=False, multitest='fdr_bh'
 ):
     """
     Compute the p-value from the Mann–Whitney U test.
@@ -19,10 +61,12 @@ def mannwhitneyu(
 
     Parameters
     ----------
-    taxon : str
-        Target taxon name.
-    csv_file : str
-        Path to the .csv file.
+    taxon : str, list, or None
+        Target taxon name. If a list of taxon names is given, test every
+        taxon and return a table. If None, test all taxa columns.
+    csv_file : str or pandas.DataFrame
+        Path to the .csv file. Alternatively, a :class:`pandas.DataFrame`
+        object with its contents, to avoid reading the file again.
     category : str
         Column name to be tested.
     group1 : str
@@ -31,12 +75,19 @@ def mannwhitneyu(
         Second group in the category column.
     ann : bool, default: False
         If True, return a signifiacne annotation instead of a p-value.
-        See `dokdo.num2sig` for how signifiacne levels are defined.
+        See `dokdo.num2sig` for how signifiacne levels are defined. For
+        multiple taxa, add an 'ann' column computed from adjusted p-values.
+    multitest : str, default: 'fdr_bh'
+        Method used for testing and adjustment of p-values, as defined in
+        :meth:`statsmodels.stats.multitest.multipletests`. Ignored when
+        ``taxon`` is a single taxon name.
 
     Returns
     -------
-    float or str
-        P-value or signifiance annotation.
+    float, str, or pandas.DataFrame
+        P-value or signifiance annotation. For multiple taxa, a table with
+        the 'taxon', 'statistic', 'pval', and 'adjp' columns sorted by
+        p-value.
 
     Examples
     --------
@@ -88,13 +139,22 @@ def mannwhitneyu(
         print(f'The p-value is {p_value:.6f}')
         # Will print: The p-value is 0.235243
     """
-    df = pd.read_csv(csv_file)
-    df = df[[taxon, category]]
-    df = df.rename(columns={taxon: 'perc'})
-    df = df.sort_values([category])
-    g1 = df[df[category] == group1]
-    g2 = df[df[category] == group2]
-    p = stats.mannwhitneyu(g1['perc'], g2['perc'])[1]
+    df = common._read_csv(csv_file)
+    if isinstance(taxon, str):
+        df = df[[taxon, category]]
+        df = df.rename(columns={taxon: 'perc'})
+        df = df.sort_values([category])
+        g1 = df[df[category] == group1]
+        g2 = df[df[category] == group2]
+        p = stats.mannwhitneyu(g1['perc'], g2['perc'])[1]
+        if ann:
+            p = num2sig(p)
+        return p
+    taxa = common._get_taxa(df, taxon)
+    x = df.loc[df[category] == group1, taxa].to_numpy(dtype=float)
+    y = df.loc[df[category] == group2, taxa].to_numpy(dtype=float)
+    statistic, p = _rank_sum_test(x, y)
+    df = common._test_table(taxa, statistic, p, multitest)
     if ann:
-        p = num2sig(p)
-    return p
+        df['ann'] = df['adjp'].map(num2sig)
+    return df
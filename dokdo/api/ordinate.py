@@ -1,13 +1,236 @@
+import os
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from qiime2 import Artifact
 from qiime2 import Metadata
 from qiime2.plugins import diversity_lib
 from qiime2.plugins import feature_table
 from qiime2.plugins import diversity
+import numpy as np
 import pandas as pd
+from scipy.spatial.distance import pdist, squareform
+from scipy.sparse.linalg import eigsh
+from skbio import DistanceMatrix
+from skbio.stats.ordination import OrdinationResults, pcoa_biplot
+from . import common
+
+def _filter_table(df, metadata):
+    """Returns the samples of the table that are in the metadata, without
+    the features that become empty, like the 'filter_samples' method of
+    the 'feature-table' plugin."""
+    df = df[df.index.isin(metadata.ids)]
+    return df.loc[:, (df != 0).any(axis=0)]
+
+def _rarefy(df, sampling_depth, seed=None):
+    """Returns the table rarefied without replacement, dropping the samples
+    with fewer counts than the sampling depth, like the 'rarefy' method of
+    the 'feature-table' plugin."""
+    counts = df.to_numpy(dtype=np.int64)
+    i = counts.sum(axis=1) >= sampling_depth
+    rng = np.random.default_rng(seed)
+    data = np.array([rng.multivariate_hypergeometric(x, sampling_depth)
+        for x in counts[i]]).reshape(-1, counts.shape[1])
+    return pd.DataFrame(data, index=df.index[i], columns=df.columns)
+
+def _distance_matrix(df, metric):
+    """Returns the condensed distance matrix between the samples."""
+    if metric == 'jaccard':
+        # The shared features of all pairs are counted with one matrix
+        # product, which is much faster than scipy's pdist.
+        x = (df.to_numpy() > 0).astype(float)
+        shared = x @ x.T
+        total = x.sum(axis=1)
+        union = total[:, None] + total[None, :] - shared
+        with np.errstate(divide='ignore', invalid='ignore'):
+            matrix = np.where(union > 0, 1 - shared / union, 0)
+        np.fill_diagonal(matrix, 0)
+        return squareform(matrix, checks=False)
+    elif metric == 'bray_curtis':
+        return pdist(df.to_numpy(dtype=float), 'braycurtis')
+    else:
+        raise ValueError(f"Incorrect metric for the 'native' engine "
+                         f"detected: {metric}")
+
+def _center(distances):
+    """Returns the double-centered matrix of squared distances, computed in
+    place to keep only one n x n matrix in memory."""
+    matrix = squareform(distances)
+    np.square(matrix, out=matrix)
+    matrix *= -0.5
+    means = matrix.mean(axis=0)
+    matrix -= means
+    matrix -= means[:, None]
+    matrix += means.mean()
+    return matrix
+
+def _randomized_eigh(matrix, k, seed=None, n_iter=7):
+    """Returns the leading eigenvalues and eigenvectors of the symmetric
+    matrix by randomized subspace iteration."""
+    rng = np.random.default_rng(seed)
+    # Eigenvalues of microbiome data decay slowly, so the subspace is
+    # generously oversampled.
+    size = min(2 * k + 20, matrix.shape[0])
+    q = np.linalg.qr(matrix @ rng.standard_normal((matrix.shape[0], size)))[0]
+    for i in range(n_iter):
+        q = np.linalg.qr(matrix @ q)[0]
+    eigvals, eigvecs = np.linalg.eigh(q.T @ matrix @ q)
+    return eigvals, q @ eigvecs
+
+def _pcoa(distances, ids, number_of_dimensions=None, method='eigh',
+    seed=None):
+    """Returns the PCoA results of the condensed distance matrix, like
+    the 'pcoa' method of the 'diversity' plugin."""
+    matrix = _center(distances)
+    if method == 'eigh' or number_of_dimensions >= matrix.shape[0] - 1:
+        eigvals, eigvecs = np.linalg.eigh(matrix)
+    elif method == 'lanczos':
+        eigvals, eigvecs = eigsh(matrix, k=number_of_dimensions, which='LA')
+    else:
+        eigvals, eigvecs = _randomized_eigh(
+            matrix, number_of_dimensions, seed=seed)
+    eigvals[np.isclose(eigvals, 0)] = 0
+    i = np.argsort(eigvals)[::-1]
+    eigvals, eigvecs = eigvals[i], eigvecs[:, i]
+    # Negative eigenvalues and their axes are set to zero.
+    eigvecs = eigvecs * (eigvals >= 0)
+    eigvals = np.maximum(eigvals, 0)
+    # The sum of all eigenvalues equals the trace, so the proportions
+    # explained are exact even when only the leading axes are computed.
+    if number_of_dimensions is None:
+        total = eigvals.sum()
+    else:
+        total = np.trace(matrix)
+        eigvals = eigvals[:number_of_dimensions]
+        eigvecs = eigvecs[:, :number_of_dimensions]
+    axes = [f'PC{i+1}' for i in range(len(eigvals))]
+    return OrdinationResults(
+        short_method_name='PCoA',
+        long_method_name='Principal Coordinate Analysis',
+        eigvals=pd.Series(eigvals, index=axes),
+        samples=pd.DataFrame(eigvecs * np.sqrt(eigvals), index=ids,
+            columns=axes),
+        proportion_explained=pd.Series(eigvals / total, index=axes))
+
+def _cache_entry(table, metadata, sampling_depth, seed, engine):
+    """Returns the cache directory for the rarefied table and distance
+    matrices of an ordination, or None if they should not be cached."""
+    cache_dir = common._export_cache['cache_dir']
+    if cache_dir is None:
+        return None
+    # Rarefying is only reproducible with the native engine and a seed.
+    if sampling_depth >= 0 and (engine != 'native' or seed is None):
+        return None
+    ids = '' if metadata is None else '\n'.join(sorted(metadata.ids))
+    key = (common._get_uuid(table), hashlib.sha1(ids.encode()).hexdigest(),
+        sampling_depth, None if sampling_depth < 0 else seed)
+    name = hashlib.sha1(repr(key).encode()).hexdigest()
+    return os.path.join(cache_dir, f'ordinate-{name}')
+
+def _load_cached(entry, name):
+    """Returns the memory-mapped array saved in the cache entry, or None."""
+    if entry is None:
+        return None
+    path = os.path.join(entry, f'{name}.npy')
+    if not os.path.isfile(path):
+        return None
+    os.utime(entry)
+    return np.load(path, mmap_mode='r')
+
+def _save_cached(entry, name, array):
+    """Saves the array in the cache entry."""
+    if entry is None:
+        return
+    os.makedirs(entry, exist_ok=True)
+    # Save to a temporary file first so that other processes never see a
+    # partially written array.
+    fd, temp = tempfile.mkstemp(prefix='.', suffix='.npy', dir=entry)
+    with os.fdopen(fd, 'wb') as f:
+        np.save(f, array)
+    os.replace(temp, os.path.join(entry, f'{name}.npy'))
+    common._evict(os.path.dirname(entry), common._export_cache['max_size'],
+        entry)
+
+def _distance_name(metric, phylogeny):
+    """Returns the name of a distance matrix in the cache entry."""
+    if metric in ['unweighted_unifrac', 'weighted_unifrac']:
+        return f'{metric}-{common._get_uuid(phylogeny)}'
+    return metric
+
+def _ordinate_native(
+    table, metadata, metrics, sampling_depth, number_of_dimensions, biplot,
+    pcoa_method, seed, n_jobs
+):
+    """Performs ordination in-process with NumPy and SciPy, returning the
+    results of each metric."""
+    entry = _cache_entry(table, metadata, sampling_depth, seed, 'native')
+    distances = {x: _load_cached(entry, x) for x in metrics}
+    missing = [x for x in metrics if distances[x] is None]
+    if missing or biplot:
+        df = table.view(pd.DataFrame)
+        if metadata is not None:
+            df = _filter_table(df, metadata)
+    if missing:
+        rarefied = _load_cached(entry, 'rarefied')
+        if rarefied is not None:
+            rarefied = pd.DataFrame(rarefied,
+                index=_load_cached(entry, 'samples'),
+                columns=_load_cached(entry, 'features'))
+        elif sampling_depth < 0:
+            rarefied = df
+        else:
+            if sampling_depth == 0:
+                sampling_depth = int(df.sum(axis=1).min())
+            rarefied = _rarefy(df, sampling_depth, seed=seed)
+            _save_cached(entry, 'features',
+                np.array(rarefied.columns, dtype=str))
+            _save_cached(entry, 'rarefied', rarefied.to_numpy())
+        _save_cached(entry, 'samples', np.array(rarefied.index, dtype=str))
+        # The distance matrices of all metrics are computed concurrently
+        # from the same rarefied table.
+        with ThreadPoolExecutor(
+            max_workers=min(n_jobs, len(missing))
+        ) as executor:
+            futures = {x: executor.submit(_distance_matrix, rarefied, x)
+                for x in missing}
+            for x, future in futures.items():
+                distances[x] = future.result()
+                _save_cached(entry, x, distances[x])
+        ids = rarefied.index
+    else:
+        ids = pd.Index(_load_cached(entry, 'samples'))
+    if biplot:
+        rf = df.loc[ids]
+        rf = rf.div(rf.sum(axis=1), axis=0)
+    artifacts = {}
+    for x in metrics:
+        results = _pcoa(distances[x], ids, number_of_dimensions,
+            method=pcoa_method or 'eigh', seed=seed)
+        if biplot:
+            artifacts[x] = Artifact.import_data(
+                "PCoAResults % Properties('biplot')", pcoa_biplot(results, rf))
+        else:
+            artifacts[x] = Artifact.import_data('PCoAResults', results)
+    return artifacts
+
+def _distance_action(table, metric, phylogeny, n_jobs):
+    """Computes the distance matrix with the 'diversity-lib' plugin."""
+    if metric == 'jaccard':
+        result = diversity_lib.methods.jaccard(table=table, n_jobs=n_jobs)
+    elif metric == 'bray_curtis':
+        result = diversity_lib.methods.bray_curtis(table=table, n_jobs=n_jobs)
+    elif metric == 'unweighted_unifrac':
+        result = diversity_lib.methods.unweighted_unifrac(table=table,
+            phylogeny=common.load_artifact(phylogeny), threads=n_jobs)
+    else:
+        result = diversity_lib.methods.weighted_unifrac(table=table,
+            phylogeny=common.load_artifact(phylogeny), threads=n_jobs)
+    return result.distance_matrix
 
 def ordinate(
     table, metadata=None, metric='jaccard', sampling_depth=-1,
-    phylogeny=None, number_of_dimensions=None, biplot=False
+    phylogeny=None, number_of_dimensions=None, biplot=False,
+    engine='qiime2', pcoa_method=None, seed=None, n_jobs=1
 ):
     """
     Perform ordination using principal coordinate analysis (PCoA).
@@ -22,6 +245,24 @@ def ordinate(
     By default, the method returns PCoAResults. For creating a biplot,
     use `biplot=True` which returns PCoAResults % Properties('biplot').
 
+    With ``engine='native'``, these steps are performed in-process with
+    NumPy and SciPy instead of QIIME 2 actions, which avoids saving and
+    loading an Artifact at each step and is considerably faster for large
+    tables. The native engine supports the 'jaccard' and 'bray_curtis'
+    metrics and gives the same distances and PCoA results as the QIIME 2
+    engine, except that rarefying is random in both engines and the signs
+    of the axes are arbitrary.
+
+    When the on-disk cache is enabled (see :meth:`set_export_cache`), the
+    rarefied table and distance matrices are saved in the cache directory
+    as .npy files, keyed by the feature table, the samples retained by
+    ``metadata``, ``sampling_depth``, ``seed``, and ``metric`` (and
+    ``phylogeny`` for UniFrac). Later calls with the same inputs load them
+    memory-mapped, so only PCoA is run again when e.g.
+    ``number_of_dimensions`` or ``biplot`` changes. Since rarefying is
+    random, results with rarefying are only cached for the 'native' engine
+    with a ``seed``.
+
     Parameters
     ----------
     table : str or qiime2.Artifact
@@ -29,9 +270,11 @@ def ordinate(
     metadata : str or qiime2.Metadata, optional
         Metadata file or object. All samples in 'metadata' that are also in
         the feature table will be retained.
-    metric : str, default: 'jaccard'
+    metric : str or list, default: 'jaccard'
         Metric used for distance matrix computation ('jaccard',
-        'bray_curtis', 'unweighted_unifrac', or 'weighted_unifrac').
+        'bray_curtis', 'unweighted_unifrac', or 'weighted_unifrac'). If a
+        list of metrics is given, perform ordination for each metric,
+        filtering and rarefying the feature table only once.
     sampling_depth : int, default: -1
         If negative, skip rarefying. If 0, rarefy to the sample with minimum
         depth. Otherwise, rarefy to the provided sampling depth.
@@ -42,12 +285,31 @@ def ordinate(
         Dimensions to reduce the distance matrix to.
     biplot : bool, default: False
         If true, return PCoAResults % Properties('biplot').
+    engine : {'qiime2', 'native'}, default: 'qiime2'
+        Whether to use QIIME 2 actions or NumPy and SciPy for computation.
+    pcoa_method : {'eigh', 'lanczos', 'randomized'}, optional
+        Method for PCoA. 'eigh' computes all axes. 'lanczos' and
+        'randomized' compute only the leading ``number_of_dimensions``
+        axes, using the Lanczos algorithm or randomized subspace
+        iteration, which is much faster and uses less memory for large
+        sample counts. If None, use the 'pcoa' method of the 'diversity'
+        plugin with the 'qiime2' engine and 'eigh' with the 'native' engine.
+    seed : int, optional
+        Seed for rarefying with the 'native' engine and for the
+        'randomized' PCoA method.
+    n_jobs : int, default: 1
+        Number of jobs for computing distance matrices. If None or
+        negative, use all CPUs. With the 'native' engine, the distance
+        matrices of multiple metrics are computed concurrently (with at
+        most one job per metric). With the 'qiime2' engine, this is passed
+        to each distance method of the 'diversity-lib' plugin.
 
     Returns
     -------
-    qiime2.Artifact
+    qiime2.Artifact or dict
         Artifact object corresponding to PCoAResults or
-        PCoAResults % Properties('biplot').
+        PCoAResults % Properties('biplot'). If a list of metrics is given,
+        a dictionary mapping each metric to its Artifact object.
 
     See Also
     --------
@@ -131,27 +393,79 @@ def ordinate(
         plt.tight_layout()
 
     .. image:: images/ordinate-3.png
+
+    You can also perform ordination with multiple metrics at once, which
+    filters and rarefies the feature table only once.
+
+    .. code:: python3
+
+        results = dokdo.ordinate(
+            qza_file,
+            metric=['jaccard', 'bray_curtis'],
+            sampling_depth=0
+        )
+
+        dokdo.beta_2d_plot(
+            results['bray_curtis'],
+            metadata=metadata_file,
+            hue='body-site',
+            figsize=(8, 8)
+        )
     """
     if isinstance(table, Artifact):
         table = table
     elif isinstance(table, str):
-        table = Artifact.load(table)
+        table = common.load_artifact(table)
     else:
         raise TypeError(f"Incorrect feature table type: {type(table)}")
 
+    if metadata is None or isinstance(metadata, Metadata):
+        _metadata = metadata
+    else:
+        _metadata = common.load_metadata(metadata)
+
+    if pcoa_method not in [None, 'eigh', 'lanczos', 'randomized']:
+        raise ValueError(f"Incorrect PCoA method detected: {pcoa_method}")
+    if pcoa_method in ['lanczos', 'randomized'] and not number_of_dimensions:
+        raise ValueError(f"The '{pcoa_method}' PCoA method requires "
+                         f"number_of_dimensions")
+
+    metrics = metric if isinstance(metric, list) else [metric]
+    if n_jobs is None or n_jobs < 0:
+        n_jobs = os.cpu_count()
+    n_jobs = max(n_jobs, 1)
+    if engine == 'native':
+        choices = ['jaccard', 'bray_curtis']
+    elif engine == 'qiime2':
+        choices = ['jaccard', 'bray_curtis', 'unweighted_unifrac',
+            'weighted_unifrac']
+    else:
+        raise ValueError(f"Incorrect engine detected: {engine}")
+    for x in metrics:
+        if x not in choices:
+            raise ValueError(f"Incorrect metric for the '{engine}' engine "
+                             f"detected: {x}")
+
+    if engine == 'native':
+        results = _ordinate_native(table, _metadata, metrics, sampling_depth,
+            number_of_dimensions, biplot, pcoa_method, seed, n_jobs)
+        return results if isinstance(metric, list) else results[metric]
+
+    # Reuse the distance matrices of a previous call if possible.
+    entry = _cache_entry(table, _metadata, sampling_depth, seed, engine)
+    names = {x: _distance_name(x, phylogeny) for x in metrics}
+    distances = {x: _load_cached(entry, names[x]) for x in metrics}
+    missing = [x for x in metrics if distances[x] is None]
+
     # If metadata is provided, perform sample filtration.
-    if metadata is not None:
-        if isinstance(metadata, Metadata):
-            _metadata = metadata
-        else:
-            _metadata = Metadata.load(metadata)
+    if _metadata is not None and (missing or biplot):
         _table = feature_table.methods.filter_samples(
             table=table, metadata=_metadata).filtered_table
     else:
         _table = table
 
     # Perform rarefying.
-    if sampling_depth < 0:
+    if not missing or sampling_depth < 0:
         rarefied_table = _table
     else:
         if sampling_depth == 0:
@@ -162,32 +476,135 @@ def ordinate(
 
         rarefied_table = rarefy_result.rarefied_table
 
-    if metric == 'jaccard':
-        distance_matrix_result = diversity_lib.methods.jaccard(
-            table=rarefied_table)
-    elif metric == 'bray_curtis':
-        distance_matrix_result = diversity_lib.methods.bray_curtis(
-            table=rarefied_table)
-    elif metric == 'unweighted_unifrac':
-        distance_matrix_result = diversity_lib.methods.unweighted_unifrac(
-            table=rarefied_table, phylogeny=Artifact.load(phylogeny))
-    elif metric == 'weighted_unifrac':
-        distance_matrix_result = diversity_lib.methods.weighted_unifrac(
-            table=rarefied_table, phylogeny=Artifact.load(phylogeny))
-    else:
-        raise ValueError(f"Incorrect metric detected: {metric}")
-
-    distance_matrix = distance_matrix_result.distance_matrix
-
-    result_obj = diversity.methods.pcoa(distance_matrix=distance_matrix,
-        number_of_dimensions=number_of_dimensions)
-    pcoa_results = result_obj.pcoa
-
     if biplot:
         rf_result = feature_table.methods.relative_frequency(table=_table)
         rf_table = rf_result.relative_frequency_table
-        result_obj = diversity.methods.pcoa_biplot(pcoa=pcoa_results,
-            features=rf_table)
-        pcoa_results = result_obj.biplot
 
-    return pcoa_results
+    results = {}
+
+    for x in metrics:
+        if distances[x] is not None:
+            dm = DistanceMatrix(squareform(distances[x]),
+                _load_cached(entry, 'samples'))
+            distance_matrix = Artifact.import_data('DistanceMatrix', dm)
+        else:
+            distance_matrix = _distance_action(
+                rarefied_table, x, phylogeny, n_jobs)
+            if entry is not None or pcoa_method is not None:
+                dm = distance_matrix.view(DistanceMatrix)
+                _save_cached(entry, 'samples', np.array(dm.ids, dtype=str))
+                _save_cached(entry, names[x], dm.condensed_form())
+
+        if pcoa_method is None:
+            result_obj = diversity.methods.pcoa(
+                distance_matrix=distance_matrix,
+                number_of_dimensions=number_of_dimensions)
+            pcoa_results = result_obj.pcoa
+        else:
+            pcoa_results = Artifact.import_data('PCoAResults',
+                _pcoa(dm.condensed_form(), dm.ids, number_of_dimensions,
+                    method=pcoa_method, seed=seed))
+
+        if biplot:
+            result_obj = diversity.methods.pcoa_biplot(pcoa=pcoa_results,
+                features=rf_table)
+            pcoa_results = result_obj.biplot
+
+        results[x] = pcoa_results
+
+    return results if isinstance(metric, list) else results[metric]
+
+def project_samples(artifact, distances):
+    """
+    Project new samples onto an existing PCoA.
+
+    This method places new samples in the space of a reference ordination
+    using only their distances to the reference samples (i.e. Gower's
+    add-a-point method), without recomputing the distance matrix or
+    eigendecomposition of the reference samples. It takes
+    O(new x reference) time.
+
+    The projection is exact for Euclidean distances and approximate for
+    other distances such as Bray-Curtis. Because the reference samples are
+    described only by their coordinates, the approximation is considerably
+    worse when the reference ordination was computed with
+    ``number_of_dimensions``, so an ordination with all axes is recommended.
+
+    Parameters
+    ----------
+    artifact : str or qiime2.Artifact
+        Artifact file or object corresponding to PCoAResults or
+        PCoAResults % Properties('biplot').
+    distances : pandas.DataFrame
+        Distances between the new samples (rows) and the reference
+        samples (columns), computed with the metric used for the reference
+        ordination. All reference samples must be present.
+
+    Returns
+    -------
+    qiime2.Artifact
+        Artifact object corresponding to PCoAResults with the reference
+        samples followed by the new samples.
+
+    See Also
+    --------
+    dokdo.api.ordinate
+    dokdo.api.beta_2d_plot
+    dokdo.api.beta_3d_plot
+
+    Examples
+    --------
+    Below is a simple example where half of the samples are used as the
+    reference and the other half are projected onto it.
+
+    .. code:: python3
+
+        import dokdo
+        from qiime2 import Artifact, Metadata
+        from scipy.spatial.distance import cdist
+        import pandas as pd
+
+        df = Artifact.load(qza_file).view(pd.DataFrame)
+        reference, new = df.iloc[::2], df.iloc[1::2]
+        pcoa_results = dokdo.ordinate(
+            Artifact.import_data('FeatureTable[Frequency]', reference),
+            metric='bray_curtis', engine='native')
+
+        distances = pd.DataFrame(
+            cdist(new, reference, 'braycurtis'),
+            index=new.index, columns=reference.index)
+
+        pcoa_results = dokdo.project_samples(pcoa_results, distances)
+
+        dokdo.beta_2d_plot(
+            pcoa_results,
+            metadata=metadata_file,
+            hue='body-site',
+            figsize=(8, 8)
+        )
+    """
+    if isinstance(artifact, str):
+        artifact = common.load_artifact(artifact)
+    ordination_results = artifact.view(OrdinationResults)
+    samples = ordination_results.samples
+    eigvals = ordination_results.eigvals.to_numpy()
+    missing = samples.index.difference(distances.columns)
+    if not missing.empty:
+        raise ValueError(f'Reference samples are missing in the distances: '
+                         f'{list(missing)!r}.')
+    x = samples.to_numpy()
+    d = distances[samples.index].to_numpy(dtype=float)
+    # Centered inner products between the new and reference samples. The
+    # squared norms of the reference coordinates stand in for the row means
+    # of the reference squared distances, as both differ by a constant.
+    b = -0.5 * (d ** 2 - (x ** 2).sum(axis=1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        y = np.where(eigvals > 0, b @ x / eigvals, 0)
+    samples = pd.concat([samples,
+        pd.DataFrame(y, index=distances.index, columns=samples.columns)])
+    return Artifact.import_data('PCoAResults', OrdinationResults(
+        short_method_name=ordination_results.short_method_name,
+        long_method_name=ordination_results.long_method_name,
+        eigvals=ordination_results.eigvals,
+        samples=samples,
+        proportion_explained=ordination_results.proportion_explained))
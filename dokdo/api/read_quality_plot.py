@@ -1,5 +1,3 @@
-import tempfile
-
 from . import common
 
 import numpy as np
@@ -60,9 +58,9 @@ def read_quality_plot(visualization, strand='forward', ax=None, figsize=None):
     .. image:: images/read_quality_plot.png
     """
 
-    with tempfile.TemporaryDirectory() as t:
-        common.export(visualization, t)
-        df = pd.read_table(f'{t}/{strand}-seven-number-summaries.tsv',
+    fn = f'{strand}-seven-number-summaries.tsv'
+    with common.open_data(visualization, fn) as f:
+        df = pd.read_table(f,
                            index_col=0,
                            skiprows=[1])
 
@@ -1,3 +1,5 @@
+from . import common
+
 import matplotlib.pyplot as plt
 import seaborn as sns
 import pandas as pd
@@ -14,8 +16,10 @@ def regplot(
     ----------
     taxon : str
         Target taxon name.
-    csv_file : str
+    csv_file : str or pandas.DataFrame
         Path to the .csv file from the `taxa_abundance_box_plot` method.
+        Alternatively, a :class:`pandas.DataFrame` object with its
+        contents, to avoid reading the file again.
     subject : str
         Column name to indicate pair information.
     category : str
@@ -104,7 +108,7 @@ def regplot(
     if ax is None:
         fig, ax = plt.subplots(figsize=figsize)
 
-    df = pd.read_csv(csv_file)
+    df = common._read_csv(csv_file)
     df = df.sort_values([subject, category])
     g1 = df[df[category] == group1]
     g2 = df[df[category] == group2]
@@ -1,62 +1,90 @@
-import tempfile
-
 from . import common
 
+import re
+
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
+from matplotlib.collections import PolyCollection
 import seaborn as sns
 
-def taxa_cols(df):
-    """Returns metadata columns from DataFrame object."""
-    cols = []
-    for col in df.columns:
-        if 'Unassigned' in col:
-            cols.append(col)
-        elif '__' in col:
-            cols.append(col)
-        else:
-            continue
-    return cols
+def _split_taxa(df):
+    """Returns taxa and metadata as two DataFrame objects.
 
-def _get_mf_cols(df):
-    """Returns metadata columns from DataFrame object."""
-    cols = []
-    for column in df.columns:
-        if 'Unassigned' in column:
-            continue
-        elif '__' in column:
-            continue
-        else:
-            cols.append(column)
-    return cols
+    The tables created by the q2-taxa plugin list all taxa columns first,
+    followed by metadata columns. The taxa block is identified once, as the
+    leading columns whose names contain '__' or 'Unassigned', so that
+    metadata columns with such names are not mistaken for taxa.
+    """
+    i = ~df.columns.astype(str).str.contains('__|Unassigned')
+    n = i.argmax() if i.any() else len(i)
+    return (df.iloc[:, :n], df.iloc[:, n:])
 
 def _filter_samples(df, mf, exclude_samples, include_samples):
-    """Returns DataFrame objects after sample filtering."""
+    """Returns DataFrame objects after sample filtering.
+
+    All filtering logic is combined into a single boolean mask, which is
+    then applied once to both objects.
+    """
     if exclude_samples and include_samples:
         m = ("Cannot use 'exclude_samples' and "
              "'include_samples' arguments together")
         raise ValueError(m)
     elif exclude_samples:
+        i = np.ones(len(mf), dtype=bool)
         for x in exclude_samples:
-            for y in exclude_samples[x]:
-                i = mf[x] != y
-                df = df.loc[i]
-                mf = mf.loc[i]
+            i &= ~mf[x].isin(exclude_samples[x]).to_numpy()
     elif include_samples:
+        i = np.ones(len(mf), dtype=bool)
         for x in include_samples:
-            i = mf[x].isin(include_samples[x])
-            df = df.loc[i]
-            mf = mf.loc[i]
+            i &= mf[x].isin(include_samples[x]).to_numpy()
     else:
-        pass
-    return (df, mf)
+        return (df, mf)
+    return (df[i], mf[i])
 
-def _sort_by_mean(df):
-    """Returns DataFrame object after sorting taxa by mean relative abundance."""
-    a = df.div(df.sum(axis=1), axis=0)
+def _sort_by_mean(df, rel=None):
+    """Returns DataFrame object after sorting taxa by mean relative abundance.
+
+    If provided, ``rel`` is used as precomputed relative abundance, which
+    must cover the samples and taxa of ``df``.
+    """
+    if rel is None:
+        a = df.div(df.sum(axis=1), axis=0)
+    else:
+        a = rel.loc[df.index, df.columns]
     a = a.loc[:, a.mean().sort_values(ascending=False).index]
     return df[a.columns]
 
+def _sort_samples(df, mf, by, orders=None):
+    """Returns DataFrame objects after sorting samples by metadata columns.
+
+    If provided, ``orders`` is used to sort the samples by the
+    user-specified order instead of ordering numerically or alphabetically.
+    """
+    keys = mf.reset_index(drop=True)
+    if isinstance(orders, dict):
+        for k, v in orders.items():
+            u = mf[k].unique().tolist()
+
+            if set(u) != set(v):
+                message = (f"Target values {u} not matched with user-provided "
+                           f"values {v} for metadata column `{k}`")
+                raise ValueError(message)
+
+            keys[k] = keys[k].map(dict(zip(v, range(len(v)))))
+    if by:
+        i = keys.sort_values(by=by).index
+        df, mf = df.iloc[i], mf.iloc[i]
+    return (df, mf)
+
+def _exclude_taxa(df, exclude_taxa):
+    """Returns DataFrame object after excluding the matched taxa."""
+    if not exclude_taxa:
+        return df
+    pattern = '|'.join([re.escape(x) for x in exclude_taxa])
+    i = df.columns.str.contains(pattern, case=False, regex=True)
+    return df.loc[:, ~i]
+
 def _get_others_col(df, count, taxa_names, show_others):
     """Returns DataFrame object after selecting taxa."""
     if count != 0 and taxa_names is not None:
@@ -80,6 +108,118 @@ def _get_others_col(df, count, taxa_names, show_others):
 
     return df
 
+def _bar_collections(df, ax, width, colors, legend):
+    """Draws stacked bars with one PolyCollection per taxon, mimicking
+    :meth:`pandas.DataFrame.plot.bar`."""
+    x = np.arange(df.shape[0])
+    left, right = x - width / 2, x + width / 2
+    values = np.nan_to_num(df.to_numpy(dtype=float))
+    tops = values.cumsum(axis=1)
+    bottoms = tops - values
+    for j, taxon in enumerate(df.columns):
+        verts = np.stack([
+            np.column_stack([left, bottoms[:, j]]),
+            np.column_stack([left, tops[:, j]]),
+            np.column_stack([right, tops[:, j]]),
+            np.column_stack([right, bottoms[:, j]]),
+        ], axis=1)
+        collection = PolyCollection(
+            verts, facecolors=colors[j % len(colors)], linewidths=0,
+            label=str(taxon), rasterized=True
+        )
+        collection.sticky_edges.y.append(0)
+        ax.add_collection(collection)
+    ax.set_xlim(-width / 2 - 0.25, x[-1] + width / 2 + 0.25)
+    ax.autoscale_view(scalex=False)
+    ax.set_xticks(x)
+    ax.set_xticklabels(df.index.astype(str), rotation=90)
+    if legend:
+        ax.legend(loc='best')
+
+def _melt(df, mf, hue):
+    """Returns DataFrame object in long format for seaborn."""
+    if hue is not None:
+        df = pd.concat([df, mf[hue]], axis=1, join='inner')
+        return pd.melt(df, id_vars=[hue])
+    return pd.melt(df)
+
+def _box_stats(x, whis=1.5):
+    """Returns box statistics for each column of the array, matching
+    :meth:`matplotlib.cbook.boxplot_stats` after removing NaN values."""
+    q1, med, q3 = np.nanpercentile(x, [25, 50, 75], axis=0)
+    mean = np.nanmean(x, axis=0)
+    iqr = q3 - q1
+    lo = np.where(x >= q1 - whis * iqr, x, np.inf).min(axis=0)
+    hi = np.where(x <= q3 + whis * iqr, x, -np.inf).max(axis=0)
+    lo = np.where(lo > q1, q1, lo)
+    hi = np.where(hi < q3, q3, hi)
+    stats = []
+    for j in range(x.shape[1]):
+        y = x[:, j]
+        stats.append({
+            'mean': mean[j], 'med': med[j], 'q1': q1[j], 'q3': q3[j],
+            'whislo': lo[j], 'whishi': hi[j],
+            'fliers': y[(y < lo[j]) | (y > hi[j])],
+        })
+    return stats
+
+def _box_bxp(df, hue, hue_order, palette, ax, **kwargs):
+    """Draws box plots from precomputed statistics, mimicking
+    :meth:`seaborn.boxplot`, and returns the hue order."""
+    x = df.to_numpy(dtype=float)
+    width = 0.8
+    if hue is None:
+        levels = [None]
+        if palette is None:
+            colors = ['C0'] * x.shape[1]
+        else:
+            colors = sns.color_palette(palette, x.shape[1])
+    else:
+        if hue_order is None:
+            hue_order = pd.unique(hue.dropna()).tolist()
+            if pd.api.types.is_numeric_dtype(hue):
+                hue_order = sorted(hue_order)
+        levels = hue_order
+        if isinstance(palette, dict):
+            colors = [palette[level] for level in levels]
+        else:
+            colors = sns.color_palette(palette, len(levels))
+    colors = [sns.desaturate(c, 0.75) for c in colors]
+    w = width / len(levels)
+    linecolor = '0.26'
+    for i, level in enumerate(levels):
+        if level is None:
+            y = x
+        else:
+            y = x[(hue == level).to_numpy()]
+        if not y.shape[0]:
+            continue
+        positions = np.arange(x.shape[1]) + w * i + w / 2 - width / 2
+        if level is None:
+            facecolors = colors
+        else:
+            facecolors = [colors[i]] * x.shape[1]
+        artists = ax.bxp(
+            _box_stats(y), positions=positions, widths=w,
+            patch_artist=True, manage_ticks=False,
+            boxprops={'edgecolor': linecolor},
+            medianprops={'color': linecolor},
+            whiskerprops={'color': linecolor},
+            capprops={'color': linecolor},
+            flierprops={'markeredgecolor': linecolor, 'markersize': 5},
+            capwidths=w / 2, **kwargs
+        )
+        for box, color in zip(artists['boxes'], facecolors):
+            box.set_facecolor(color)
+        if level is not None:
+            artists['boxes'][0].set_label(level)
+    ax.set_xticks(np.arange(x.shape[1]))
+    ax.set_xticklabels(df.columns)
+    ax.set_xlim(-0.5, x.shape[1] - 0.5)
+    if hue is not None:
+        ax.legend(title=hue.name)
+    return hue_order
+
 def taxa_abundance_bar_plot(
     visualization, metadata=None, level=1, group=None, group_order=None, by=None,
     ax=None, figsize=None, width=0.8, count=0, exclude_samples=None,
@@ -87,7 +227,8 @@ def taxa_abundance_bar_plot(
     colors=None, label_columns=None, orders=None, sample_names=None,
     csv_file=None, taxa_names=None, sort_by_mean1=True,
     sort_by_mean2=True, sort_by_mean3=True, show_others=True,
-    cmap_name='Accent', legend_short=False, pname_kws=None, legend=True
+    cmap_name='Accent', legend_short=False, pname_kws=None, legend=True,
+    fast=False
 ):
     """
     Create a bar plot showing relative taxa abundance for individual samples.
@@ -118,7 +259,8 @@ def taxa_abundance_bar_plot(
     ----------
     visualization : str, qiime2.Visualization, or pandas.DataFrame
         Visualization file or object from the q2-taxa plugin. Alternatively,
-        a :class:`pandas.DataFrame` object.
+        a :class:`pandas.DataFrame` object, in which taxa columns must come
+        before any metadata columns.
     metadata : str or qiime2.Metadata, optional
         Metadata file or object.
     level : int, default: 1
@@ -185,6 +327,12 @@ def taxa_abundance_bar_plot(
         is True.
     legend : bool, default: True
         Whether to plot the legend.
+    fast : bool, default: False
+        If true, draw each taxon as a single rasterized collection of bars
+        instead of one rectangle per sample. This renders and saves much
+        faster for thousands of samples, and produces smaller vector files.
+        With that many samples, most of the remaining time is spent on
+        sample labels, which can be removed with ``ax.set_xticks([])``.
 
     Returns
     -------
@@ -511,136 +659,21 @@ def taxa_abundance_bar_plot(
 
     .. image:: images/taxa_abundance_bar_plot-13.png
     """
-    if isinstance(visualization, pd.DataFrame):
-        df = visualization
-    else:
-        with tempfile.TemporaryDirectory() as t:
-            common.export(visualization, t)
-            df = pd.read_csv(f'{t}/level-{level}.csv', index_col=0)
-
-    if sort_by_mean1:
-        cols = _get_mf_cols(df)
-        mf = df[cols]
-        df = df.drop(columns=cols)
-        df = _sort_by_mean(df)
-        df = pd.concat([df, mf], axis=1, join='inner')
-
-    # If provided, update the metadata.
-    if metadata is None:
-        pass
-    else:
-        mf = common.get_mf(metadata)
-        cols = _get_mf_cols(df)
-        df.drop(columns=cols, inplace=True)
-        df = pd.concat([df, mf], axis=1, join='inner')
-
-    # If provided, sort the samples by the user-specified order instead of
-    # ordering numerically or alphabetically. To do this, we will first add a
-    # new temporary column filled with the indicies of the user-provided
-    # list. This column will be used for sorting the samples later instead of
-    # the original column. After sorting, the new column will be dropped from
-    # the dataframe and the original column will replace its place.
-    if isinstance(orders, dict):
-        for k, v in orders.items():
-            u = df[k].unique().tolist()
-
-            if set(u) != set(v):
-                message = (f"Target values {u} not matched with user-provided "
-                           f"values {v} for metadata column `{k}`")
-                raise ValueError(message)
-
-            l = [x for x in range(len(v))]
-            d = dict(zip(v, l))
-            df.rename(columns={k: f'@{k}'}, inplace=True)
-            df[k] = df[f'@{k}'].map(d)
-
-    df["sample-id"] = df.index
-
-    # If provided, sort the samples for display in the x-axis.
-    if isinstance(by, list):
-        df = df.sort_values(by=by)
-
-    # If sorting was performed by the user-specified order, remove the
-    # temporary columns and then bring back the original column.
-    if isinstance(orders, dict):
-        for k in orders:
-            df.drop(columns=[k], inplace=True)
-            df.rename(columns={f'@{k}': k}, inplace=True)
-
-    # If provided, exclude the specified taxa.
-    if isinstance(exclude_taxa, list):
-        dropped = []
-        for tax in exclude_taxa:
-            for col in df.columns:
-                if tax.lower() in col.lower():
-                    dropped.append(col)
-        dropped = list(set(dropped))
-        df = df.drop(columns=dropped)
-
-    # If provided, group the samples by the given metadata column.
-    if group is not None:
-        df = df.groupby(group)[taxa_cols(df)].agg('sum')
-
-    # Remove the metadata columns.
-    cols = _get_mf_cols(df)
-    mf = df[cols]
-    df = df.drop(columns=cols)
-
-    if group is not None and group_order is not None:
-        df = df.loc[group_order]
-
-    df, mf = _filter_samples(df, mf, exclude_samples, include_samples)
-
-    if sort_by_mean2:
-        df = _sort_by_mean(df)
-
-    # If provided, only include the specified samples.
-    if isinstance(sample_names, list):
-        df = df.loc[sample_names]
-        mf = mf.loc[sample_names]
-
-        if sort_by_mean3:
-            df = _sort_by_mean(df)
-
-    # Convert counts to proportions.
-    df = df.div(df.sum(axis=1), axis=0)
-
-    df = _get_others_col(df, count, taxa_names, show_others)
-
-    if sort_by_names:
-        df = df.reindex(sorted(df.columns), axis=1)
-
-    if ax is None:
-        fig, ax = plt.subplots(figsize=figsize)
-
-    if isinstance(colors, list):
-        c = colors
-    else:
-        c = plt.cm.get_cmap(cmap_name).colors
-
-    df = df * 100
-
-    # If provided, output the dataframe as a .csv file.
-    if csv_file is not None:
-        df.to_csv(csv_file)
-
-    if legend_short:
-        if pname_kws is None:
-            pname_kws = {}
-        df.columns = [common.pname(x, **pname_kws) for x in df.columns]
-
-    df.plot.bar(
-        stacked=True, legend=legend, ax=ax, width=width, color=c, linewidth=0
+    ta = TaxaAbundance(visualization, metadata=metadata)
+
+    return ta.bar_plot(
+        level=level, group=group, group_order=group_order, by=by, ax=ax,
+        figsize=figsize, width=width, count=count,
+        exclude_samples=exclude_samples, include_samples=include_samples,
+        exclude_taxa=exclude_taxa, sort_by_names=sort_by_names,
+        colors=colors, label_columns=label_columns, orders=orders,
+        sample_names=sample_names, csv_file=csv_file, taxa_names=taxa_names,
+        sort_by_mean1=sort_by_mean1, sort_by_mean2=sort_by_mean2,
+        sort_by_mean3=sort_by_mean3, show_others=show_others,
+        cmap_name=cmap_name, legend_short=legend_short, pname_kws=pname_kws,
+        legend=legend, fast=fast
     )
 
-    ax.set_xlabel('')
-    ax.set_ylabel('Relative abundance (%)')
-    if label_columns is not None:
-        f = lambda row: ' : '.join(row.values.astype(str))
-        xticklabels = mf[label_columns].apply(f, axis=1).tolist()
-        ax.set_xticklabels(xticklabels)
-
-    return ax
 
 def taxa_abundance_box_plot(
     visualization, metadata=None, hue=None, hue_order=None,
@@ -650,7 +683,7 @@ def taxa_abundance_box_plot(
     taxa_names=None, pretty_taxa=False, show_means=False,
     meanprops=None, show_others=True, sort_by_mean=True,
     add_datapoints=False, jitter=1, alpha=None, size=5, palette=None,
-    ax=None, figsize=None,
+    ax=None, figsize=None, fast=False, max_datapoints=None
 ):
     """
     Create a box plot showing the distribution of relative abundance for
@@ -735,6 +768,15 @@ def taxa_abundance_box_plot(
         Axes object to draw the plot onto, otherwise uses the current Axes.
     figsize : tuple, optional
         Width, height in inches. Format: (float, float).
+    fast : bool, default: False
+        If true, compute the box statistics for all taxa at once and draw
+        them with :meth:`matplotlib.axes.Axes.bxp`, instead of passing the
+        data in long format to :meth:`seaborn.boxplot`. This is much faster
+        and uses less memory for thousands of samples.
+    max_datapoints : int, optional
+        Ignored when ``add_datapoints=False``. Maximum number of samples to
+        show as data points. If there are more samples, a random subset of
+        them is shown. The boxes are always computed from all samples.
 
     Returns
     -------
@@ -846,114 +888,331 @@ def taxa_abundance_box_plot(
 
     .. image:: images/taxa_abundance_box_plot-5.png
     """
-    with tempfile.TemporaryDirectory() as t:
-        common.export(visualization, t)
-        df = pd.read_csv(f'{t}/level-{level}.csv', index_col=0)
+    ta = TaxaAbundance(visualization, metadata=metadata)
+
+    return ta.box_plot(
+        hue=hue, hue_order=hue_order, level=level, by=by, count=count,
+        exclude_samples=exclude_samples, include_samples=include_samples,
+        exclude_taxa=exclude_taxa, sort_by_names=sort_by_names,
+        sample_names=sample_names, csv_file=csv_file,
+        pseudocount=pseudocount, taxa_names=taxa_names,
+        pretty_taxa=pretty_taxa, show_means=show_means, meanprops=meanprops,
+        show_others=show_others, sort_by_mean=sort_by_mean,
+        add_datapoints=add_datapoints, jitter=jitter, alpha=alpha, size=size,
+        palette=palette, ax=ax, figsize=figsize, fast=fast,
+        max_datapoints=max_datapoints
+    )
 
-    # If provided, update the metadata.
-    if metadata is None:
-        pass
-    else:
-        mf = common.get_mf(metadata)
-        cols = _get_mf_cols(df)
-        df.drop(columns=cols, inplace=True)
-        df = pd.concat([df, mf], axis=1, join='inner')
+class TaxaAbundance:
+    """
+    Taxa abundance data for repeated bar and box plotting.
 
-    df["sample-id"] = df.index
+    The :meth:`taxa_abundance_bar_plot` and :meth:`taxa_abundance_box_plot`
+    methods load and prepare the data from scratch every time they are
+    called. This class does it once for each taxonomic level, and caches the
+    counts, the sample metadata, the relative abundance, and the order of
+    taxa by mean relative abundance. Subsequent plots with different
+    options only do the remaining work such as sample filtration.
 
-    # If provided, sort the samples for display in the x-axis.
-    if by:
-        df = df.sort_values(by=by)
+    Parameters
+    ----------
+    visualization : str, qiime2.Visualization, or pandas.DataFrame
+        Visualization file or object from the q2-taxa plugin. Alternatively,
+        a :class:`pandas.DataFrame` object, in which case the ``level``
+        argument of the plotting methods is ignored. Taxa columns must come
+        before any metadata columns.
+    metadata : str or qiime2.Metadata, optional
+        Metadata file or object. If provided, replace the sample metadata
+        contained in the visualization.
+
+    See Also
+    --------
+    dokdo.api.taxa_abundance_bar_plot
+    dokdo.api.taxa_abundance_box_plot
 
-    # If provided, exclude the specified taxa.
-    if isinstance(exclude_taxa, list):
-        dropped = []
-        for tax in exclude_taxa:
-            for col in df.columns:
-                if tax.lower() in col.lower():
-                    dropped.append(col)
-        dropped = list(set(dropped))
-        df = df.drop(columns=dropped)
+    Examples
+    --------
 
-    # Remove the metadata columns.
-    cols = _get_mf_cols(df)
-    mf = df[cols]
-    df = df.drop(columns=cols)
+    .. code:: python3
 
-    df, mf = _filter_samples(df, mf, exclude_samples, include_samples)
+        ta = dokdo.TaxaAbundance(qzv_file)
 
-    # If provided, only include the specified samples.
-    if isinstance(sample_names, list):
-        df = df.loc[sample_names]
-        mf = mf.loc[sample_names]
+        fig, [ax1, ax2] = plt.subplots(1, 2, figsize=(16, 7))
 
-    if sort_by_mean:
-        df = _sort_by_mean(df)
+        ta.bar_plot(level=6, count=8, ax=ax1, legend=False)
+        ta.bar_plot(level=6, count=8, group='body-site', ax=ax2)
+    """
+    def __init__(self, visualization, metadata=None):
+        self.visualization = visualization
+        self.metadata = metadata
+        self._levels = {}
+
+    def _get_level(self, level):
+        """Returns the cached data for the given taxonomic level."""
+        if isinstance(self.visualization, pd.DataFrame):
+            level = None
+        if level not in self._levels:
+            if level is None:
+                df = self.visualization
+            else:
+                with common.open_data(
+                    self.visualization, f'level-{level}.csv'
+                ) as f:
+                    df = pd.read_csv(f, index_col=0)
+            counts, mf = _split_taxa(df)
+            df = counts
+            if self.metadata is not None:
+                mf = common.get_mf(self.metadata)
+                i = df.index.intersection(mf.index)
+                df, mf = df.loc[i], mf.loc[i]
+            self._levels[level] = {'counts': counts, 'df': df, 'mf': mf}
+        return self._levels[level]
+
+    def _get_rel(self, level):
+        """Returns the cached relative abundance for the given taxonomic
+        level."""
+        data = self._get_level(level)
+        if 'rel' not in data:
+            counts = data['counts']
+            data['rel'] = counts.div(counts.sum(axis=1), axis=0)
+        return data['rel']
+
+    def _get_order(self, level):
+        """Returns the cached order of taxa by mean relative abundance for
+        the given taxonomic level, before sample filtration."""
+        data = self._get_level(level)
+        if 'order' not in data:
+            data['order'] = _sort_by_mean(
+                data['counts'], self._get_rel(level)).columns
+        return data['order']
+
+    def bar_plot(
+        self, level=1, group=None, group_order=None, by=None, ax=None,
+        figsize=None, width=0.8, count=0, exclude_samples=None,
+        include_samples=None, exclude_taxa=None, sort_by_names=False,
+        colors=None, label_columns=None, orders=None, sample_names=None,
+        csv_file=None, taxa_names=None, sort_by_mean1=True,
+        sort_by_mean2=True, sort_by_mean3=True, show_others=True,
+        cmap_name='Accent', legend_short=False, pname_kws=None, legend=True,
+        fast=False
+    ):
+        """
+        Create a bar plot showing relative taxa abundance for individual
+        samples.
+
+        See :meth:`taxa_abundance_bar_plot` for the description of the
+        arguments.
+
+        Returns
+        -------
+        matplotlib.axes.Axes
+            Axes object with the plot drawn onto it.
+        """
+        data = self._get_level(level)
+        df, mf = data['df'], data['mf']
+
+        # The cached relative abundance is only valid while the original
+        # taxa are kept for the original samples.
+        rel = self._get_rel(level)
+
+        if sort_by_mean1:
+            df = df[self._get_order(level)]
+
+        mf = mf.assign(**{'sample-id': mf.index})
+
+        # If provided, sort the samples for display in the x-axis.
+        df, mf = _sort_samples(
+            df, mf, by if isinstance(by, list) else None, orders)
+
+        # If provided, exclude the specified taxa.
+        if isinstance(exclude_taxa, list):
+            df = _exclude_taxa(df, exclude_taxa)
+            rel = None
+
+        # If provided, group the samples by the given metadata column.
+        if group is not None:
+            df = df.groupby(mf[group]).agg('sum')
+            mf = df[[]]
+            rel = None
+
+        if group is not None and group_order is not None:
+            df = df.loc[group_order]
+
+        df, mf = _filter_samples(df, mf, exclude_samples, include_samples)
+
+        if sort_by_mean2:
+            df = _sort_by_mean(df, rel)
+
+        # If provided, only include the specified samples.
+        if isinstance(sample_names, list):
+            df = df.loc[sample_names]
+            mf = mf.loc[sample_names]
+
+            if sort_by_mean3:
+                df = _sort_by_mean(df, rel)
+
+        # Convert counts to proportions.
+        if rel is None:
+            df = df.div(df.sum(axis=1), axis=0)
+        else:
+            df = rel.loc[df.index, df.columns]
 
-    if ax is None:
-        fig, ax = plt.subplots(figsize=figsize)
+        df = _get_others_col(df, count, taxa_names, show_others)
 
-    # Add a pseudocount.
-    if pseudocount:
-        df = df + 1
+        if sort_by_names:
+            df = df.reindex(sorted(df.columns), axis=1)
 
-    # Convert counts to proportions.
-    df = df.div(df.sum(axis=1), axis=0)
+        if ax is None:
+            fig, ax = plt.subplots(figsize=figsize)
 
-    df = _get_others_col(df, count, taxa_names, show_others)
+        if isinstance(colors, list):
+            c = colors
+        else:
+            c = plt.cm.get_cmap(cmap_name).colors
 
-    if sort_by_names:
-        df = df.reindex(sorted(df.columns), axis=1)
+        df = df * 100
 
-    _taxa_names = df.columns
+        # If provided, output the dataframe as a .csv file.
+        if csv_file is not None:
+            df.to_csv(csv_file)
 
-    df = df * 100
+        if legend_short:
+            if pname_kws is None:
+                pname_kws = {}
+            df.columns = [common.pname(x, **pname_kws) for x in df.columns]
 
-    if hue is not None:
-        df2 = pd.concat([df, mf[hue]], axis=1, join='inner')
-        df2 = pd.melt(df2, id_vars=[hue])
-    else:
-        df2 = pd.melt(df)
+        if fast:
+            _bar_collections(df, ax, width, c, legend)
+        else:
+            df.plot.bar(
+                stacked=True, legend=legend, ax=ax, width=width, color=c,
+                linewidth=0
+            )
 
-    if meanprops:
-        _meanprops = meanprops
-    else:
-        _meanprops={'marker':'x',
-                    'markerfacecolor':'white',
-                    'markeredgecolor':'white',
-                    'markersize':'10'}
+        ax.set_xlabel('')
+        ax.set_ylabel('Relative abundance (%)')
+        if label_columns is not None:
+            f = lambda row: ' : '.join(row.values.astype(str))
+            xticklabels = mf[label_columns].apply(f, axis=1).tolist()
+            ax.set_xticklabels(xticklabels)
+
+        return ax
+
+    def box_plot(
+        self, hue=None, hue_order=None, level=1, by=None, count=0,
+        exclude_samples=None, include_samples=None, exclude_taxa=None,
+        sort_by_names=False, sample_names=None, csv_file=None,
+        pseudocount=False, taxa_names=None, pretty_taxa=False,
+        show_means=False, meanprops=None, show_others=True,
+        sort_by_mean=True, add_datapoints=False, jitter=1, alpha=None,
+        size=5, palette=None, ax=None, figsize=None, fast=False,
+        max_datapoints=None
+    ):
+        """
+        Create a box plot showing the distribution of relative abundance
+        for individual taxa.
+
+        See :meth:`taxa_abundance_box_plot` for the description of the
+        arguments.
+
+        Returns
+        -------
+        matplotlib.axes.Axes
+            Axes object with the plot drawn onto it.
+        """
+        data = self._get_level(level)
+        df, mf = data['df'], data['mf']
+        rel = self._get_rel(level)
+
+        mf = mf.assign(**{'sample-id': mf.index})
+
+        # If provided, sort the samples for display in the x-axis.
+        df, mf = _sort_samples(df, mf, by)
+
+        # If provided, exclude the specified taxa.
+        if isinstance(exclude_taxa, list):
+            df = _exclude_taxa(df, exclude_taxa)
+            rel = None
+
+        df, mf = _filter_samples(df, mf, exclude_samples, include_samples)
+
+        # If provided, only include the specified samples.
+        if isinstance(sample_names, list):
+            df = df.loc[sample_names]
+            mf = mf.loc[sample_names]
+
+        if sort_by_mean:
+            df = _sort_by_mean(df, rel)
+
+        if ax is None:
+            fig, ax = plt.subplots(figsize=figsize)
+
+        # Convert counts to proportions, after adding a pseudocount.
+        if pseudocount:
+            df = df + 1
+            df = df.div(df.sum(axis=1), axis=0)
+        elif rel is None:
+            df = df.div(df.sum(axis=1), axis=0)
+        else:
+            df = rel.loc[df.index, df.columns]
 
-    d = {}
+        df = _get_others_col(df, count, taxa_names, show_others)
 
-    if show_means:
-        d['showmeans'] = True
-        d['meanprops'] = _meanprops
+        if sort_by_names:
+            df = df.reindex(sorted(df.columns), axis=1)
 
-    sns.boxplot(
-        x='variable', y='value', hue=hue, hue_order=hue_order, data=df2,
-        ax=ax, palette=palette, **d
-    )
+        _taxa_names = df.columns
 
-    if add_datapoints:
-        sns.stripplot(
-            x='variable', y='value', hue=hue, hue_order=hue_order, data=df2,
-            ax=ax, color='black', size=size, dodge=True, jitter=jitter,
-            alpha=alpha
-        )
+        df = df * 100
+
+        if meanprops:
+            _meanprops = meanprops
+        else:
+            _meanprops={'marker':'x',
+                        'markerfacecolor':'white',
+                        'markeredgecolor':'white',
+                        'markersize':'10'}
+
+        d = {}
+
+        if show_means:
+            d['showmeans'] = True
+            d['meanprops'] = _meanprops
+
+        if fast:
+            hue_order = _box_bxp(
+                df, None if hue is None else mf[hue], hue_order, palette,
+                ax, **d
+            )
+        else:
+            sns.boxplot(
+                x='variable', y='value', hue=hue, hue_order=hue_order,
+                data=_melt(df, mf, hue), ax=ax, palette=palette, **d
+            )
+
+        if add_datapoints:
+            df2 = df
+            if max_datapoints is not None and df.shape[0] > max_datapoints:
+                df2 = df.sample(n=max_datapoints, random_state=0)
+            sns.stripplot(
+                x='variable', y='value', hue=hue, hue_order=hue_order,
+                data=_melt(df2, mf, hue), ax=ax, color='black', size=size,
+                dodge=True, jitter=jitter, alpha=alpha
+            )
 
-    # If provided, output the dataframe as a .csv file.
-    if csv_file is not None:
-        df3 = pd.concat([df, mf], axis=1, join='inner')
-        df3.to_csv(csv_file)
+        # If provided, output the dataframe as a .csv file.
+        if csv_file is not None:
+            df3 = pd.concat([df, mf], axis=1, join='inner')
+            df3.to_csv(csv_file)
 
-    if pretty_taxa:
-        l = [common.pname(x.get_text()) for x in ax.get_xticklabels()]
-        ax.set_xticklabels(l)
+        if pretty_taxa:
+            l = [common.pname(x.get_text()) for x in ax.get_xticklabels()]
+            ax.set_xticklabels(l)
 
-    ax.set_xlabel('')
-    ax.set_ylabel('Relative abundance (%)')
+        ax.set_xlabel('')
+        ax.set_ylabel('Relative abundance (%)')
 
-    for ticklabel in ax.get_xticklabels():
-        ticklabel.set_rotation(90)
+        for ticklabel in ax.get_xticklabels():
+            ticklabel.set_rotation(90)
 
-    return ax
+        return ax
@@ -1,40 +1,118 @@
+import biom
 import numpy as np
 import pandas as pd
-from skbio.stats.composition import clr
+from scipy import sparse
 from qiime2 import Artifact
+from . import common
 
-def import_feature_table(artifact):
+def import_feature_table(artifact, sparse=False):
     """
     Import given feature table.
+
+    If ``sparse`` is True, the artifact is viewed as :class:`biom.Table` and
+    returned as a :class:`pandas.DataFrame` with sparse columns, without
+    ever materializing the dense samples x features matrix.
     """
+    if isinstance(artifact, str):
+        artifact = common.load_artifact(artifact)
     if isinstance(artifact, Artifact):
-        df = artifact.view(pd.DataFrame)
-    elif isinstance(artifact, str):
-        df = Artifact.load(artifact).view(pd.DataFrame)
+        if sparse:
+            table = artifact.view(biom.Table)
+            df = pd.DataFrame.sparse.from_spmatrix(
+                table.matrix_data.T.tocsr(),
+                index=pd.Index(table.ids(axis='sample')),
+                columns=pd.Index(table.ids(axis='observation')))
+        else:
+            df = artifact.view(pd.DataFrame)
     elif isinstance(artifact, pd.DataFrame):
         df = artifact
     else:
         raise TypeError(f"Incorrect input type: {type(artifact)}")
     return df
 
-def normalize_feature_table(df, method):
+def is_sparse(df):
+    """
+    Return True if all columns of given feature table are sparse.
+    """
+    return df.shape[1] > 0 and all(
+        isinstance(x, pd.SparseDtype) for x in df.dtypes)
+
+def to_csr(df):
+    """
+    Return the samples x features matrix of given sparse feature table.
+    """
+    return df.sparse.to_coo().tocsr()
+
+def normalize_feature_table(df, method, dtype=None, copy=True):
     """
     Normalize given feature table.
+
+    The transformation is applied to the underlying array in one pass. Input
+    can be a :class:`pandas.DataFrame` (dense or sparse), a NumPy array, or a
+    SciPy sparse matrix, with rows indicating samples. The 'log10' method
+    keeps sparse input sparse because it maps zeros to zeros, while 'clr'
+    and 'zscore' return dense output. Use ``dtype='float32'`` to halve
+    memory, and ``copy=False`` to allow transforming dense input in place.
     """
+    if method not in ['log10', 'clr', 'zscore']:
+        raise ValueError(f"Incorrect normalization method: {method}")
+
+    if isinstance(df, pd.DataFrame):
+        if is_sparse(df):
+            a = to_csr(df)
+        else:
+            a = df.to_numpy()
+        a = normalize_feature_table(a, method, dtype=dtype, copy=copy)
+        if sparse.issparse(a):
+            return pd.DataFrame.sparse.from_spmatrix(
+                a, index=df.index, columns=df.columns)
+        return pd.DataFrame(a, index=df.index, columns=df.columns, copy=False)
+
+    if dtype is None:
+        dtype = np.result_type(df.dtype, np.float64)
+
+    if sparse.issparse(df):
+        a = df.astype(dtype, copy=copy)
+        if method == 'log10':
+            np.log1p(a.data, out=a.data)
+            a.data /= np.log(10)
+            return a
+        if method == 'clr':
+            # Log-transform the non-zero entries only; log(0 + 1) is zero.
+            np.log1p(a.data, out=a.data)
+            means = np.asarray(a.mean(axis=1))
+            return a.toarray() - means
+        a = a.toarray()
+    else:
+        a = np.array(df, dtype=dtype) if copy else np.asarray(df, dtype)
+        if not a.flags.writeable:
+            a = a.copy()
+
     if method == 'log10':
-        df = df.applymap(lambda x: np.log10(x + 1))
+        np.log1p(a, out=a)
+        a /= np.log(10)
     elif method == 'clr':
-        df = df.apply(lambda x: clr(x + 1), axis=1, result_type='broadcast')
-    elif method == 'zscore':
-        df = df.apply(zscore, axis=1, result_type='broadcast')
+        np.log1p(a, out=a)
+        a -= a.mean(axis=1, keepdims=True)
     else:
-        raise ValueError(f"Incorrect normalization method: {method}")
-    return df
+        means = a.mean(axis=1, keepdims=True)
+        stds = a.std(axis=1, keepdims=True)
+        a -= means
+        with np.errstate(divide='ignore', invalid='ignore'):
+            a /= stds
+    return a
 
 def sort_by_mean(df):
     """
     Sort given feature table by mean taxa abundance.
     """
+    if is_sparse(df):
+        m = to_csr(df)
+        sums = np.asarray(m.sum(axis=1)).ravel()
+        with np.errstate(divide='ignore'):
+            scale = np.where(sums > 0, 1 / sums, 0)
+        means = np.asarray((sparse.diags(scale) @ m).mean(axis=0)).ravel()
+        return df.iloc[:, np.argsort(-means, kind='stable')]
     _ = df.div(df.sum(axis=1), axis=0)
     _ = _.loc[:, _.mean().sort_values(ascending=False).index]
     return df[_.columns]
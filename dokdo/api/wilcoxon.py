@@ -1,10 +1,63 @@
-import pandas as pd
-from scipy import stats
+from . import common
 from .num2sig import num2sig
 
+import numpy as np
+from scipy import stats
+
+def _signed_rank_test(x, y):
+    """Returns the statistics and p-values of the Wilcoxon signed-rank test
+    for every column of the paired arrays, following the defaults of the
+    :meth:`scipy.stats.wilcoxon()` method (i.e. zero differences are
+    dropped and the test is exact for small samples)."""
+    d = x - y
+    n = d.shape[0]
+    a = np.abs(d)
+    zeros = a == 0
+    count = n - zeros.sum(axis=0)
+    # Ranks among the non-zero differences, and the size of each tie group.
+    r = stats.rankdata(a, axis=0) - (n - count)
+    r[zeros] = 0
+    t = stats.rankdata(a, 'max', axis=0) - stats.rankdata(a, 'min', axis=0)
+    t[zeros] = 0
+    tie_term = (t * (t + 2)).sum(axis=0)
+    r_plus = (r * (d > 0)).sum(axis=0)
+    r_minus = (r * (d < 0)).sum(axis=0)
+    mn = count * (count + 1) / 4
+    with np.errstate(divide='ignore', invalid='ignore'):
+        se = np.sqrt((count * (count + 1) * (2 * count + 1) - tie_term / 2)
+            / 24)
+        p = 2 * stats.norm.sf(np.abs(r_plus - mn) / se)
+    valid = ~np.isnan(d).any(axis=0)
+    if n <= 50:
+        exact = valid & (((tie_term == 0) & (count == n)) | (n <= 13))
+        if exact.any():
+            p[exact] = _signed_rank_exact(r[:, exact], r_plus[exact])
+    p[~valid] = np.nan
+    return np.minimum(r_plus, r_minus), np.clip(p, 0, 1)
+
+def _signed_rank_exact(r, r_plus):
+    """Returns the exact p-values of the signed-rank test by enumerating
+    the sums of ranks over all sign assignments of each column."""
+    # Ranks are multiples of 0.5, so they are doubled to become integers.
+    w = np.rint(r * 2).astype(int)
+    size = w.sum(axis=0).max() + 1
+    i = np.arange(size)
+    counts = np.zeros((w.shape[1], size))
+    counts[:, 0] = 1
+    for row in w:
+        j = i - row[:, None]
+        counts += np.where(
+            j >= 0, np.take_along_axis(counts, np.maximum(j, 0), axis=1), 0)
+    cdf = counts.cumsum(axis=1) / counts.sum(axis=1, keepdims=True)
+    k = np.rint(r_plus * 2).astype(int)[:, None]
+    less = np.take_along_axis(cdf, k, axis=1)[:, 0]
+    greater = 1 - np.take_along_axis(cdf, k - 1, axis=1)[:, 0]
+    greater[k[:, 0] == 0] = 1
+    return 2 * np.minimum(less, greater)
+
 def wilcoxon(
     taxon, csv_file, subject, category,
-    group1, group2, ann=False
+    group1, group2, ann=False, multitest='fdr_bh'
 ):
     """
     Compute the p-value from the Wilcoxon Signed-rank test.
@@ -19,10 +72,12 @@ def wilcoxon(
 
     Parameters
     ----------
-    taxon : str
-        Target taxon name.
-    csv_file : str
-        Path to the .csv file.
+    taxon : str, list, or None
+        Target taxon name. If a list of taxon names is given, test every
+        taxon and return a table. If None, test all taxa columns.
+    csv_file : str or pandas.DataFrame
+        Path to the .csv file. Alternatively, a :class:`pandas.DataFrame`
+        object with its contents, to avoid reading the file again.
     subject : str
         Column name to indicate pair information.
     category : str
@@ -33,12 +88,19 @@ def wilcoxon(
         Second group in the category column.
     ann : bool, default: False
         If True, return a signifiacne annotation instead of a p-value.
-        See `dokdo.num2sig` for how signifiacne levels are defined.
+        See `dokdo.num2sig` for how signifiacne levels are defined. For
+        multiple taxa, add an 'ann' column computed from adjusted p-values.
+    multitest : str, default: 'fdr_bh'
+        Method used for testing and adjustment of p-values, as defined in
+        :meth:`statsmodels.stats.multitest.multipletests`. Ignored when
+        ``taxon`` is a single taxon name.
 
     Returns
     -------
-    float or str
-        P-value or signifiance annotatiom.
+    float, str, or pandas.DataFrame
+        P-value or signifiance annotatiom. For multiple taxa, a table with
+        the 'taxon', 'statistic', 'pval', and 'adjp' columns sorted by
+        p-value.
 
     Examples
     --------
@@ -108,11 +170,19 @@ def wilcoxon(
         print(f'The p-value is {p_value:.6f}')
         # Will print: The p-value is 0.062500
     """
-    df = pd.read_csv(csv_file)
+    df = common._read_csv(csv_file)
     df = df.sort_values([subject, category])
     g1 = df[df[category] == group1]
     g2 = df[df[category] == group2]
-    p = stats.wilcoxon(g1[taxon], g2[taxon])[1]
+    if isinstance(taxon, str):
+        p = stats.wilcoxon(g1[taxon], g2[taxon])[1]
+        if ann:
+            p = num2sig(p)
+        return p
+    taxa = common._get_taxa(df, taxon)
+    statistic, p = _signed_rank_test(
+        g1[taxa].to_numpy(dtype=float), g2[taxa].to_numpy(dtype=float))
+    df = common._test_table(taxa, statistic, p, multitest)
     if ann:
-        p = num2sig(p)
-    return p
+        df['ann'] = df['adjp'].map(num2sig)
+    return df
@@ -1,12 +1,70 @@
 import os
+import biom
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pandas as pd
+from scipy import sparse
 from qiime2 import Artifact
-from qiime2.plugins import taxa
 
-def collapse(table_file, taxonomy_file, output_dir):
+def _parse_taxonomy(taxonomy, feature_ids):
+    """Return the level-7 label of each feature, following the rules of
+    the 'qiime taxa collapse' command (i.e. ranks are stripped and missing
+    ranks are padded with '__')."""
+    ranks = taxonomy.map(lambda x: [y.strip() for y in x.split(';')])
+    max_level = ranks.map(len).max()
+    if max_level < 7:
+        raise ValueError(f'Requested level of 7 is larger than the maximum '
+                         f'level available in taxonomy data ({max_level}).')
+    missing = set(feature_ids) - set(taxonomy.index)
+    if missing:
+        raise ValueError(f'Feature IDs found in the table are missing in the '
+                         f'taxonomy: {missing!r}.')
+    return [';'.join((x + ['__'] * (max_level - len(x)))[:7])
+        for x in ranks[feature_ids]]
+
+def _iter_levels(table, labels):
+    """Yield the collapsed table of each taxonomic level, from level 7 to
+    level 1. Each level is aggregated from the previous finer one."""
+    sample_ids = table.ids(axis='sample')
+    codes, labels = pd.factorize(np.array(labels, dtype=object))
+    matrix = table.matrix_data.tocsr().astype(np.float64)
+    for level in range(7, 0, -1):
+        indicator = sparse.csr_matrix(
+            (np.ones(len(codes)), (codes, np.arange(len(codes)))),
+            shape=(len(labels), len(codes)))
+        matrix = indicator @ matrix
+        yield level, pd.DataFrame(
+            matrix.toarray(), index=labels, columns=sample_ids)
+        codes, labels = pd.factorize(
+            np.array([x.rsplit(';', 1)[0] for x in labels], dtype=object))
+
+def _write_level(df, path, format):
+    """Write the collapsed table of a taxonomic level in the given format."""
+    if format == 'csv':
+        df.to_csv(path)
+    elif format == 'csv.gz':
+        df.to_csv(path, compression={'method': 'gzip', 'compresslevel': 6})
+    elif format == 'parquet':
+        df.to_parquet(path)
+    else:
+        df.rename_axis('index').reset_index().to_feather(path)
+
+def collapse(table_file, taxonomy_file, output_dir, format='csv', threads=1):
     """Create seven collapsed feature tables, one for each taxonomic
     level (i.e. 'level-1.csv' to 'level-7.csv').
 
+    The taxonomy is parsed only once and each level is aggregated from the
+    previous finer one, which gives the same tables as running the
+    'qiime taxa collapse' command for each level.
+
+    Each table has taxa as rows and samples as columns. Parquet tables keep
+    taxa in the index, while Feather tables store them in a column named
+    'index'. To obtain the input for
+    :meth:`dokdo.api.taxa_abundance.taxa_abundance_bar_plot`, load a table
+    with :meth:`pandas.read_csv` (``index_col=0``),
+    :meth:`pandas.read_parquet`, or :meth:`pandas.read_feather` (followed by
+    ``.set_index('index')``) and transpose it.
+
     Parameters
     ----------
     table_file : str
@@ -15,12 +73,21 @@ def collapse(table_file, taxonomy_file, output_dir):
         Path to the taxonomy file with the 'FeatureData[Taxonomy]' type.
     output_dir : str
         Path to the output directory.
+    format : {'csv', 'csv.gz', 'parquet', 'feather'}, default: 'csv'
+        Output file format. The 'parquet' and 'feather' formats require
+        the pyarrow package.
+    threads : int, default: 1
+        Number of threads used to write the tables concurrently.
     """
+    if format not in ['csv', 'csv.gz', 'parquet', 'feather']:
+        raise ValueError(f"Incorrect output format: '{format}'")
+    table = Artifact.load(table_file).view(biom.Table)
+    taxonomy = Artifact.load(taxonomy_file).view(pd.Series)
+    labels = _parse_taxonomy(taxonomy, table.ids(axis='observation'))
     os.mkdir(output_dir)
-    for i in range(1, 8):
-        _ = taxa.methods.collapse(
-            table=Artifact.load(table_file),
-            taxonomy=Artifact.load(taxonomy_file),
-            level=i)
-        _.collapsed_table.view(pd.DataFrame).T.to_csv(
-            f"{output_dir}/level-{i}.csv")
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        futures = [executor.submit(_write_level, df,
+            f"{output_dir}/level-{level}.{format}", format)
+            for level, df in _iter_levels(table, labels)]
+        for future in futures:
+            future.result()